@@ -1,18 +1,33 @@
-import csv
-import random
+import os
+import sys
+import threading
+import time
+
+# Time the program started (taken before the other imports so they are included)
+START_TIME = time.perf_counter()
+
 from tkinter import *
 from functools import partial  # To prevent unwanted windows
+from C_06_Colour_Catalog import get_catalog
+from C_07_Game_Engine import MAX_COLOURS, MIN_COLOURS, GameSession
+from C_14_History_Store import get_history_store, get_player_name
+from C_15_Leaderboard import Leaderboard
+from C_17_Instrumentation import ENABLED as METRICS_ENABLED, summary as metrics_summary, timed, timer
+from C_18_Loop_Monitor import monitored, start_monitor
+from C_19_RGB_Catalog import get_rgb_catalog
+from C_21_Score_Baselines import STRATEGIES, get_game_baselines, get_round_baselines
 
+# Set COLOUR_QUEST_TIMINGS=1 to see how long the game takes to start
+SHOW_TIMINGS = bool(os.environ.get("COLOUR_QUEST_TIMINGS"))
 
-def round_ans(val):
-    """
-    Rounds numbers to nearest integer
-    :param val: number to be rounded.
-    :return: rounded number
-    """
-    var_rounded = (val * 2 + 1) // 2
-    raw_rounded = "{:.0f}".format(var_rounded)
-    return int(raw_rounded)
+# Bars for the score spread in the Stats dialogue (no rounds -> most rounds)
+SPREAD_BARS = " ▁▂▃▄▅▆▇█"
+
+# How often (ms) an open Stats dialogue checks whether background work has finished
+STATS_REFRESH = 250
+
+# How often (ms) a new game checks whether its first round is ready
+READY_CHECK = 20
 
 
 # helper functions go here
@@ -23,45 +38,35 @@ def get_colours():
     colour name, associated score and foreground colour for the text
     """
 
-    file = open("00_colour_list_hex_v3(in).csv", "r")
-    file.close()
+    # Colours are read from the file once and then kept in memory
+    return get_catalog().get_colours()
 
 
-def get_round_colours():
+def show_startup_time(stage):
     """
-    Choose four colours from larger list ensuring that the scores are all different
-    :return: list of colours and score to beat (median of scores)
+    Prints how long it has been since the program started (only if timings are on)
+    :param stage: what has just happened
     """
-    # Retrieve colours from csv file and put them in a list
-    file = open("00_colour_list_hex_v3(in).csv", "r")
-    all_colours = list(csv.reader(file, delimiter=","))
-    file.close()
-
-    # Remove the first row
-    all_colours.pop(0)
-
-    round_colours = []
-    colour_scores = []
-
-    # loop until we have four colours with different scores...
-    while len(round_colours) < 4:
-        potential_colour = random.choice(all_colours)
-
-        # Get the score and check it's not a duplicate
-        if potential_colour[1] not in colour_scores:
-            round_colours.append(potential_colour)
-            colour_scores.append(potential_colour[1])
+    if SHOW_TIMINGS:
+        print(f"{stage}: {(time.perf_counter() - START_TIME) * 1000:.1f} ms", file=sys.stderr)
 
-    # Find target score (median)
-    int_scores = [int(x) for x in colour_scores]
-    int_scores.sort()
 
-    # Calculate the median
-    median = (int_scores[1] + int_scores[2]) / 2
-    median = round_ans(median)
-    highest = int_scores[-1]
+def preload_colours():
+    """
+    Loads the colours in the background while the start screen is showing
+    so the first round doesn't have to wait for them.  Nothing here is
+    needed straight away (the game loads anything missing when it is used),
+    so a failure is only reported.
+    """
+    try:
+        get_colours()
+        show_startup_time("Colours loaded")
 
-    return round_colours, median, highest
+        # Work out the expected scores for the Stats dialogue too (four colours per round)
+        get_round_baselines()
+        show_startup_time("Expected scores ready")
+    except Exception as error:
+        print(f"Background work failed (preload colours): {error}", file=sys.stderr)
 
 
 class StartGame:
@@ -119,6 +124,28 @@ class StartGame:
                                   command=self.check_rounds)
         self.play_button.grid(row=0, column=1)
 
+        # Hard mode uses every RGB colour instead of the named colours
+        self.hard_mode = BooleanVar(value=False)
+        self.hard_mode_check = Checkbutton(self.start_frame, font=("Arial", "12"),
+                                           text="Hard mode (any of 16.7 million colours)",
+                                           variable=self.hard_mode)
+        self.hard_mode_check.grid(row=4, pady=5)
+
+        # Number of colours to choose from each round
+        self.colours_frame = Frame(self.start_frame)
+        self.colours_frame.grid(row=5)
+
+        self.colours_label = Label(self.colours_frame, text="Colours per round",
+                                   font=("Arial", "12"))
+        self.colours_label.grid(row=0, column=0, padx=10)
+
+        self.colours_spinbox = Spinbox(self.colours_frame, from_=MIN_COLOURS, to=MAX_COLOURS,
+                                       font=("Arial", "12"), width=5)
+        self.colours_spinbox.delete(0, END)
+        self.colours_spinbox.insert(0, "4")
+        self.colours_spinbox.grid(row=0, column=1)
+
+    @monitored
     def check_rounds(self):
         """
         Checks users have entered 1 or more rounds
@@ -137,17 +164,36 @@ class StartGame:
         # checks that amount to be converted is a number above absolute 0
         try:
             rounds_wanted = int(rounds_wanted)
-            if rounds_wanted > 0:
-                # Invoke Play Class (and take across number of rounds)
-                self.num_rounds_entry.delete(0, END)
-                self.choose_label.config(text="How many rounds do you want to play?")
-                Play(rounds_wanted)
-                # Hide root window (ieL hide rounds choice window)
-                root.withdraw()
+        except ValueError:
+            rounds_wanted = 0
+
+        if rounds_wanted > 0:
+            # Every colour in a round needs a different score, so the
+            # catalog limits how many colours there can be
+            catalog = get_rgb_catalog() if self.hard_mode.get() else get_catalog()
+            most_colours = min(MAX_COLOURS, len(catalog.get_score_buckets()))
+
+            try:
+                colours_wanted = int(self.colours_spinbox.get())
+            except ValueError:
+                colours_wanted = 0
+
+            if MIN_COLOURS <= colours_wanted <= most_colours:
+                try:
+                    # Invoke Play Class (and take across number of rounds)
+                    Play(rounds_wanted, self.hard_mode.get(), colours_wanted)
+                except ValueError as play_error:
+                    has_errors = "yes"
+                    error = str(play_error)
+                else:
+                    self.num_rounds_entry.delete(0, END)
+                    self.choose_label.config(text="How many rounds do you want to play?")
+                    # Hide root window (ieL hide rounds choice window)
+                    root.withdraw()
             else:
                 has_errors = "yes"
-
-        except ValueError:
+                error = f"Please choose {MIN_COLOURS} - {most_colours} colours per round"
+        else:
             has_errors = "yes"
 
         # display the error if necessary
@@ -163,24 +209,34 @@ class Play:
     Interface for playing the game
     """
 
-    def __init__(self, how_many):
-
-        # Integers / String Variables
-        self.target_score = IntVar()
-
-        # rounds played - start with zero
-        self.rounds_played = IntVar()
-        self.rounds_played.set(0)
-
-        self.rounds_wanted = IntVar()
-        self.rounds_wanted.set(how_many)
-
-        self.rounds_won = IntVar()
-
-        # Colour lists and score list
+    def __init__(self, how_many, hard_mode=False, colours_per_round=4):
+
+        # Game rules (rounds, scores and stats) live in the game session,
+        # which also records each round in the history store
+        catalog = get_rgb_catalog() if hard_mode else None
+        self.game = GameSession(how_many, catalog=catalog, history=get_history_store(),
+                                player=get_player_name(), colours_per_round=colours_per_round,
+                                hard_mode=hard_mode)
+
+        # Hard mode colours are named by their hex code (which gives the score
+        # away), so the buttons are left blank until the result is shown
+        self.hard_mode = hard_mode
+
+        # Slow work (round table, stats) is done on worker threads so it never
+        # holds up the window - name -> result once it has finished
+        self.background_results = {}
+        self.background_started = set()
+        self.background_tokens = {}
+        self.stats_refresh_waiting = False
+
+        # Expected scores for this number of colours per round (can take a few
+        # seconds) and the player's leaderboard place before this game
+        self.run_in_background("baselines", get_round_baselines, self.game.catalog,
+                               colours_per_round)
+        self.run_in_background("rank", self.find_rank)
+
+        # Colours for the current round
         self.round_colour_list = []
-        self.all_scores_list = []
-        self.all_high_score_list = []
 
         self.play_box = Toplevel()
 
@@ -209,13 +265,15 @@ class Play:
         # List to hold buttons once they have been made
         self.colour_ref_list = []
 
-        # Create four buttons in a 2 x 2 grid
-        for item in range(0, 4):
+        # Create a button for each colour (2 x 2 grid for four colours, rows of
+        # four for more).  The buttons are reused every round.
+        columns = 2 if colours_per_round <= 4 else 4
+        for item in range(0, colours_per_round):
             self.color_button = Button(self.colour_frame, font="Arial 12",
-                                       text="Colour Name", width=15,
+                                       text="Colour Name", width=15, state=DISABLED,
                                        command=partial(self.round_results, item))
-            self.color_button.grid(row=item // 2,
-                                   column=item % 2,
+            self.color_button.grid(row=item // columns,
+                                   column=item % columns,
                                    padx=5, pady=5)
             self.colour_ref_list.append(self.color_button)
 
@@ -263,36 +321,62 @@ class Play:
 
         self.stats_button.config(state=DISABLED)
 
+        # True once the first round has started (nothing can be used before then)
+        self.ready = False
+
+        # Hints / Stats dialogues are built the first time they are needed
+        # and then shown / hidden after that
+        self.help_dialogue = None
+        self.stats_dialogue = None
+
         # Once interface has been created, invoke new round function for first round
-        self.new_round()
+        # (after the round table has been loaded on a worker thread - it can take a
+        # few seconds to make the first time)
+        self.next_round_button.config(state=DISABLED)
+        self.hints_button.config(state=DISABLED)
+        self.run_in_background("round_table", self.game.get_round_table)
+        self.start_when_ready()
+
+    def start_when_ready(self):
+        """
+        Starts the first round once the round table is ready (checks again
+        shortly if it isn't)
+        """
+        if "round_table" in self.get_pending():
+            self.play_box.after(READY_CHECK, self.start_when_ready)
+        else:
+            self.ready = True
+            self.hints_button.config(state=NORMAL)
+            self.new_round()
 
+    @monitored
     def to_hints(self):
         """
         Displays hints for playing game
         """
-        rounds_played = self.rounds_played.get()
-        DisplayHelp(self, rounds_played)
+        rounds_played = self.game.rounds_played
+        if self.help_dialogue is None:
+            self.help_dialogue = DisplayHelp(self)
+
+        self.help_dialogue.show_help(self, rounds_played)
 
+    @monitored
+    @timed("play.new_round")
     def new_round(self):
         """
-        Chooses four colours, works out median for score to beat. Configures buttons
+        Chooses the round's colours, works out median for score to beat. Configures buttons
         with chosen colours
         """
 
-        # retrieve number of rounds played, add one to it and configure heading
-        rounds_played = self.rounds_played.get()
-        rounds_played += 1
-        self.rounds_played.set(rounds_played)
-
-        rounds_wanted = self.rounds_wanted.get()
-
-        # get round colours and median score...
-        self.round_colour_list, median, highest = get_round_colours()
+        # Only start a round once the last one has been played (and if there is one left)
+        if self.game.is_game_over() or self.game.round_in_progress:
+            return
 
-        self.target_score.set(median)
+        # get round colours and median score (game session keeps track of rounds / high scores)
+        self.round_colour_list, median, highest = self.game.new_round()
 
-        # add high score to list for stats...
-        self.all_high_score_list.append(highest)
+        rounds_played = self.game.rounds_played
+        rounds_wanted = self.game.rounds_wanted
 
         # Update heading, and score to beat labels. "Hide" results label
         self.game_heading_label.config(text=f"Round {rounds_played} of {rounds_wanted}")
@@ -301,42 +385,46 @@ class Play:
 
         # configure buttons using foreground and background colours from list
         # enable colour buttons (disabled at the end of the last round)
-        for count, item in enumerate(self.colour_ref_list):
-            item.config(fg=self.round_colour_list[count][2],
-                        bg=self.round_colour_list[count][0],
-                        text=self.round_colour_list[count][0], state=NORMAL)
+        with timer("play.new_round.buttons"):
+            for count, item in enumerate(self.colour_ref_list):
+                item.config(fg=self.round_colour_list[count][2],
+                            bg=self.round_colour_list[count][0],
+                            text="" if self.hard_mode else self.round_colour_list[count][0],
+                            state=NORMAL)
 
         self.next_round_button.config(state=DISABLED)
 
+    def update_next_button(self):
+        """
+        Enables 'Next Round' only when a colour has been chosen and there are
+        rounds left (used when dialogues are closed)
+        """
+        if not self.ready or self.game.round_in_progress or self.game.is_game_over():
+            self.next_round_button.config(state=DISABLED)
+        else:
+            self.next_round_button.config(state=NORMAL)
+
+    @monitored
+    @timed("play.round_results")
     def round_results(self, user_choice):
         """
-        Retrieves which button was pushed (index 0-3), retrieves
+        Retrieves which button was pushed (index 0 onwards), retrieves
         score and then compares it within median, updates results
         and adds itself to the stats list
         """
 
-        # Get user score and colour based on button press
-        score = int(self.round_colour_list[user_choice][1])
-
-        # alternate way to get button name. Good for if buttons have been scrambled
-        colour_name = self.colour_ref_list[user_choice].cget('text')
+        # Compare user score with the target (game session updates the stats lists)
+        result = self.game.choose(user_choice)
+        score = result.score
+        colour_name = result.colour[0]
 
-        # retrieve target score and compare with user score to find round result
-        target = self.target_score.get()
-
-        if score >= target:
+        if result.won:
             result_text = f"Success! {colour_name} earned you {score} points"
             result_bg = "#82b366"
-            self.all_scores_list.append(score)
-
-            rounds_won = self.rounds_won.get()
-            rounds_won += 1
-            self.rounds_won.set(rounds_won)
 
         else:
             result_text = f"Oops {colour_name} ({score}) is less than the target"
             result_bg = "#f8cecc"
-            self.all_scores_list.append(0)
 
         self.result_label.config(text=result_text, bg=result_bg)
 
@@ -344,13 +432,15 @@ class Play:
         self.next_round_button.config(state=NORMAL)
         self.stats_button.config(state=NORMAL)
 
-        # check to see if game is over
-        rounds_played = self.rounds_played.get()
-        rounds_wanted = self.rounds_wanted.get()
+        # Choose the next round's colours once the result has been drawn, so
+        # clicking 'Next Round' only has to change the buttons
+        root.after_idle(self.game.prefetch_round)
 
-        rounds_won = self.rounds_won.get()
+        # check to see if game is over
+        rounds_played = self.game.rounds_played
+        rounds_won = self.game.rounds_won
 
-        if rounds_played == rounds_wanted:
+        if self.game.is_game_over():
             success_rate = rounds_won / rounds_played * 100
             success_string = (f"Success Rate: {rounds_won} / {rounds_played}"
                               f" ({success_rate:.0f}%)")
@@ -363,21 +453,128 @@ class Play:
             self.stats_button.config(bg="#990000")
             self.end_game_button.config(text="Play Again", bg="#006600")
 
+            self.save_replay()
+
+            # This game now counts towards the leaderboard
+            self.run_in_background("rank", self.find_rank)
+
         for item in self.colour_ref_list:
             item.config(state=DISABLED)
 
+    def run_in_background(self, name, function, *args):
+        """
+        Runs slow work on a worker thread.  The result goes in background_results
+        (None if it failed) for the window to pick up - worker threads must
+        not touch the window themselves.
+        """
+        self.background_results.pop(name, None)
+        self.background_started.add(name)
+
+        # Only the latest run of each piece of work gets to put its result in
+        token = object()
+        self.background_tokens[name] = token
+
+        def work():
+            try:
+                result = function(*args)
+            except Exception as error:
+                print(f"Background work failed ({name}): {error}", file=sys.stderr)
+                result = None
+            if self.background_tokens.get(name) is token:
+                self.background_results[name] = result
+
+        threading.Thread(target=work, name=f"stats-{name}", daemon=True).start()
+
+    def get_pending(self):
+        """
+        :return: names of the background work which hasn't finished yet
+        """
+        return {name for name in self.background_started if name not in self.background_results}
+
+    def find_rank(self):
+        """
+        Finds the player's place on the leaderboard for this kind of game (runs
+        on a worker thread - finished games are saved first so this game counts)
+        :return: rank | players | total score (None if not on the leaderboard)
+        """
+        history = self.game.history
+        if history is None:
+            return None
+
+        if self.game.is_game_over():
+            history.flush()
+        return Leaderboard(history.db_file).rank(self.game.player, board=self.game.board)
+
+    def refresh_stats(self):
+        """
+        Shows the stats again once background work has finished (if the
+        dialogue is still open)
+        """
+        self.stats_refresh_waiting = False
+
+        stat_box = self.stats_dialogue.stat_box
+        if stat_box.winfo_exists() and stat_box.state() == "normal":
+            self.to_stats()
+
+    @monitored
     def to_stats(self):
         """
         Displays everything we need to display the game / round statistics
         """
 
-        # IMPORTANT: retrieve number of rounds won as a number (rather than the 'self' container)
-        rounds_won = self.rounds_won.get()
-        stats_bundle = [rounds_won, self.all_scores_list, self.all_high_score_list]
+        # rounds won | rounds played | success rate | total | max possible | best | average
+        stats_bundle = self.game.stats()
+
+        # Work still going on in the background (checked before the results are
+        # read, so anything which finishes in between is shown next time)
+        pending = self.get_pending()
+
+        # Leaderboard place (found on a worker thread when the game starts / ends)
+        leaderboard_rank = self.background_results.get("rank")
 
-        Stats(self, stats_bundle)
+        # What random / greedy / perfect players would expect from the same number
+        # of rounds (only once the worker thread has worked out a single round)
+        baselines = None
+        if self.background_results.get("baselines") is not None:
+            baselines = get_game_baselines(stats_bundle[1], self.game.catalog,
+                                           self.game.colours_per_round)
 
+        if self.stats_dialogue is None:
+            self.stats_dialogue = Stats(self)
+
+        # median | 90th percentile | score -> rounds (from running counts, so any game length is fine)
+        accumulator = self.game.accumulator
+        score_spread = [accumulator.percentile(50), accumulator.percentile(90),
+                        accumulator.get_distribution()]
+
+        self.stats_dialogue.show_stats(self, stats_bundle, leaderboard_rank, baselines,
+                                       score_spread, pending)
+
+        # Fill in the rest when the worker threads have finished
+        if pending and not self.stats_refresh_waiting:
+            self.stats_refresh_waiting = True
+            self.play_box.after(STATS_REFRESH, self.refresh_stats)
+
+    def save_replay(self):
+        """
+        Saves the game's seed and choices so it can be replayed later
+        (see C_16_Replay_Log)
+        """
+        replay_log = self.game.replay_log
+        if replay_log is None or not replay_log.choices:
+            return
+
+        try:
+            replay_log.save()
+        except OSError as error:
+            print(f"Replay couldn't be saved: {error}", file=sys.stderr)
+
+    @monitored
     def close_play(self):
+        # Games ended early are saved here (finished games were saved when they ended)
+        if not self.game.is_game_over():
+            self.save_replay()
+
         # Reshow root (ie: choose rounds) and end current game / allow new game to start
         root.deiconify()
         self.play_box.destroy()
@@ -385,18 +582,18 @@ class Play:
 
 class DisplayHelp:
 
-    def __init__(self, partner, rounds_played):
-        self.rounds_played = rounds_played
+    @timed("dialogue.help.build")
+    def __init__(self, partner):
+        """
+        Builds the hints dialogue once (it is hidden until needed and
+        then shown / hidden rather than being rebuilt each time)
+        """
+        self.rounds_played = 0
 
         # set up dialogue box and background color
         background = "#ffe6cc"
-        self.help_box = Toplevel()
-
-        # disable button
-        partner.hints_button.config(state=DISABLED)
-        partner.end_game_button.config(state=DISABLED)
-        partner.stats_button.config(state=DISABLED)
-        partner.next_round_button.config(state=DISABLED)
+        self.help_box = Toplevel(partner.play_box)
+        self.help_box.withdraw()
 
         # If users press 'X' instead of dismiss, unblocks help button
         self.help_box.protocol('WM_DELETE_WINDOW',
@@ -441,37 +638,46 @@ class DisplayHelp:
         for item in recolour_list:
             item.config(bg=background)
 
+    @timed("dialogue.help.show")
+    def show_help(self, partner, rounds_played):
+        """
+        Shows the (already built) hints dialogue
+        """
+        self.rounds_played = rounds_played
+
+        # disable button
+        partner.hints_button.config(state=DISABLED)
+        partner.end_game_button.config(state=DISABLED)
+        partner.stats_button.config(state=DISABLED)
+        partner.next_round_button.config(state=DISABLED)
+
+        self.help_box.deiconify()
+        self.help_box.lift()
+
+    @monitored
     def close_help(self, partner):
         partner.hints_button.config(state=NORMAL)  # Re-enable the button
         partner.end_game_button.config(state=NORMAL)
-        partner.next_round_button.config(state=NORMAL)
+        partner.update_next_button()
 
-        # only enable stats button if we have played any rounds
-        if self.rounds_played == 0:
+        # only enable stats button if a round has been finished
+        if partner.game.accumulator.rounds_played > 0:
             partner.stats_button.config(state=NORMAL)
 
-        self.help_box.destroy()
+        # Hide the dialogue so it can be shown again without rebuilding it
+        self.help_box.withdraw()
 
 
 class Stats:
 
-    def __init__(self, partner, all_stats_info):
-
-        # Extract information from master list...
-        rounds_won = all_stats_info[0]
-        user_scores = all_stats_info[1]
-        high_scores = all_stats_info[2]
-
-        # Sort user scores to find high score
-        user_scores.sort()
-
-        self.stat_box = Toplevel()
-
-        # disable button
-        partner.stats_button.config(state=DISABLED)
-        partner.hints_button.config(state=DISABLED)
-        partner.end_game_button.config(state=DISABLED)
-        partner.next_round_button.config(state=DISABLED)
+    @timed("dialogue.stats.build")
+    def __init__(self, partner):
+        """
+        Builds the stats dialogue once (it is hidden until needed and then
+        only the label text is changed each time it is shown)
+        """
+        self.stat_box = Toplevel(partner.play_box)
+        self.stat_box.withdraw()
 
         # If users press 'X' instead of dismiss, unblocks stat button
         self.stat_box.protocol('WM_DELETE_WINDOW',
@@ -481,15 +687,83 @@ class Stats:
                                 height=200)
         self.stat_frame.grid()
 
-        # Math to populate Stats dialogue...
-        rounds_played = len(user_scores)
+        heading_font = "Arial 16 bold"
+        normal_font = "Arial 14"
+        comment_font = "Arial 13"
+
+        # Label list (text | font | 'Sticky') - text is filled in when the stats are shown
+        all_stats_strings = [
+            ["Statistics", heading_font, ""],
+            ["", normal_font, "W"],
+            ["", normal_font, "W"],
+            ["", normal_font, "W"],
+            ["", comment_font, "W"],
+            ["\nRound Stats", heading_font, ""],
+            ["", normal_font, "W"],
+            ["", normal_font, "W"],
+            ["", normal_font, "W"],
+            ["", normal_font, "W"],
+            ["", "Courier 11", "W"],
+            ["Expected Scores", heading_font, ""],
+            ["", comment_font, "W"],
+            ["", comment_font, "W"],
+            ["", comment_font, "W"]
+        ]
+
+        self.stats_label_ref_list = []
+        for count, item in enumerate(all_stats_strings):
+            self.stats_label = Label(self.stat_frame, text=item[0], font=item[1],
+                                     anchor="w", justify="left",
+                                     padx=30, pady=5)
+            self.stats_label.grid(row=count, sticky=item[2], padx=10)
+            self.stats_label_ref_list.append(self.stats_label)
+
+        self.dismiss_button = Button(self.stat_frame,
+                                     font="Arial 16 bold", text="Dismiss",
+                                     bg="#333333", fg="#ffffff", width=20,
+                                     command=partial(self.close_stat, partner))
+        self.dismiss_button.grid(row=15, padx=10, pady=10)
+
+        # Timings button / label (only when metrics are being collected)
+        if METRICS_ENABLED:
+            self.timings_button = Button(self.stat_frame,
+                                         font="Arial 12 bold", text="Timings",
+                                         bg="#666666", fg="#ffffff", width=20,
+                                         command=self.show_timings)
+            self.timings_button.grid(row=16, padx=10, pady=5)
+
+            self.timings_label = Label(self.stat_frame, text="", font="Courier 9",
+                                       anchor="w", justify="left", padx=10)
+            self.timings_label.grid(row=17, sticky="W", padx=10)
+
+    @monitored
+    def show_timings(self):
+        """
+        Shows how long each part of the game has taken so far
+        """
+        self.timings_label.config(text="\n".join(metrics_summary()) or "Nothing timed yet")
+
+    @timed("dialogue.stats.show")
+    def show_stats(self, partner, all_stats_info, leaderboard_rank=None, baselines=None,
+                   score_spread=None, pending=()):
+        """
+        Updates the stats labels and shows the dialogue
+        :param leaderboard_rank: rank | players | total score (None if not on the leaderboard)
+        :param baselines: expected results of each way of playing | True if they are
+        estimated (see C_21_Score_Baselines.get_game_baselines)
+        :param score_spread: median | 90th percentile | dictionary of score -> rounds
+        :param pending: stats still being worked out in the background (eg: baselines)
+        """
 
-        success_rate = rounds_won / rounds_played * 100
-        total_score = sum(user_scores)
-        max_possible = sum(high_scores)
+        # Extract information from master list (worked out as the rounds were played)...
+        rounds_won, rounds_played, success_rate, total_score, max_possible, best_score, \
+            average_score = all_stats_info
 
-        best_score = user_scores[-1]
-        average_score = total_score / rounds_played
+        # disable button
+        partner.stats_button.config(state=DISABLED)
+        partner.hints_button.config(state=DISABLED)
+        partner.end_game_button.config(state=DISABLED)
+        partner.next_round_button.config(state=DISABLED)
 
         # Strings for Stats labels
 
@@ -512,54 +786,95 @@ class Stats:
             comment_string = ""
             comment_colour = "#f0f0f0"
 
-        average_score_string = f"Average Score: {average_score:.0f}\n"
+        average_score_string = f"Average Score: {average_score:.0f}"
 
-        heading_font = "Arial 16 bold"
-        normal_font = "Arial 14"
-        comment_font = "Arial 13"
+        if "rank" in pending:
+            rank_string = "Leaderboard Rank: working it out..."
+        elif leaderboard_rank is None:
+            rank_string = "Leaderboard Rank: n/a"
+        else:
+            rank_string = f"Leaderboard Rank: {leaderboard_rank[0]} of {leaderboard_rank[1]}"
 
-        # Label list (text | font | 'Sticky')
-        all_stats_strings = [
-            ["Statistics", heading_font, ""],
-            [success_string, normal_font, "W"],
-            [total_score_string, normal_font, "W"],
-            [max_possible_string, normal_font, "W"],
-            [comment_string, comment_font, "W"],
-            ["\nRound Stats", heading_font, ""],
-            [best_score_string, normal_font, "W"],
-            [average_score_string, normal_font, "W"]
+        # Median / percentile and a bar for each score (taller bars = more rounds)
+        if score_spread is None or score_spread[0] is None:
+            percentile_string = "Median Score: n/a"
+            spread_string = "\n"
+        else:
+            median, ninetieth, distribution = score_spread
+            percentile_string = f"Median Score: {median} (90th percentile: {ninetieth})"
+
+            most_rounds = max(distribution.values())
+            bars = "".join(SPREAD_BARS[-(-distribution.get(score, 0) * (len(SPREAD_BARS) - 1)
+                                         // most_rounds)]
+                           for score in range(max(distribution) + 1))
+            spread_string = f"Scores 0 - {max(distribution)}: {bars}\n"
+
+        # Label position | new text
+        changed_labels = [
+            [1, success_string],
+            [2, total_score_string],
+            [3, max_possible_string],
+            [4, comment_string],
+            [6, best_score_string],
+            [7, average_score_string],
+            [8, rank_string],
+            [9, percentile_string],
+            [10, spread_string]
         ]
 
-        stats_label_ref_list = []
-        for count, item in enumerate(all_stats_strings):
-            self.stats_label = Label(self.stat_frame, text=item[0], font=item[1],
-                                     anchor="w", justify="left",
-                                     padx=30, pady=5)
-            self.stats_label.grid(row=count, sticky=item[2], padx=10)
-            stats_label_ref_list.append(self.stats_label)
+        # Expected scores (one label per strategy)
+        for position, strategy in enumerate(STRATEGIES, start=12):
+            if "baselines" in pending:
+                baseline_string = f"{STRATEGIES[strategy]}: working it out..."
+            elif baselines is None:
+                baseline_string = f"{STRATEGIES[strategy]}: n/a"
+            else:
+                # (estimates are from random rounds when there are too many colours per round)
+                game_baselines, estimated = baselines
+                approx = "≈" if estimated else ""
+                expected_score, deviation, rounds_won, win_chance = game_baselines[strategy]
+                baseline_string = (f"{STRATEGIES[strategy]}: {approx}{expected_score:.0f} points "
+                                   f"({approx}{win_chance * 100:.0f}% of rounds won"
+                                   f"{', estimated' if estimated else ''})")
+            changed_labels.append([position, baseline_string])
+
+        for position, text in changed_labels:
+            self.stats_label_ref_list[position].config(text=text)
 
         # Configure comment label background (for all won / all lost)
-        stats_comment_label = stats_label_ref_list[4]
+        stats_comment_label = self.stats_label_ref_list[4]
         stats_comment_label.config(bg=comment_colour)
 
-        self.dismiss_button = Button(self.stat_frame,
-                                     font="Arial 16 bold", text="Dismiss",
-                                     bg="#333333", fg="#ffffff", width=20,
-                                     command=partial(self.close_stat, partner))
-        self.dismiss_button.grid(row=8, padx=10, pady=10)
+        self.stat_box.deiconify()
+        self.stat_box.lift()
 
+    @monitored
     def close_stat(self, partner):
         partner.stats_button.config(state=NORMAL)  # Re-enable the button
         partner.hints_button.config(state=NORMAL)
         partner.end_game_button.config(state=NORMAL)
-        partner.next_round_button.config(state=NORMAL)
+        partner.update_next_button()
 
-        self.stat_box.destroy()
+        # Hide the dialogue so it can be shown again without rebuilding it
+        self.stat_box.withdraw()
 
 
 # main routine
 if __name__ == "__main__":
+    show_startup_time("Imports finished")
+
+    # Read the colours while the start screen is being built / shown
+    threading.Thread(target=preload_colours, daemon=True).start()
+
     root = Tk()
     root.title("Colour Quest")
     StartGame()
+
+    # Draw the start screen now so the time is taken once it is on the screen
+    # (an idle callback can run before the window has been drawn)
+    root.update_idletasks()
+    show_startup_time("Start screen ready")
+
+    # Set COLOUR_QUEST_LOOP_MONITOR=1 to see how long callbacks hold up the window
+    start_monitor(root)
     root.mainloop()
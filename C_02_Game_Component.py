@@ -1,7 +1,6 @@
-import csv
-import random
 from tkinter import *
 from functools import partial  # To prevent unwanted windows
+from C_06_Colour_Catalog import get_catalog
 
 
 def round_ans(val):
@@ -23,35 +22,22 @@ def get_colours():
     colour name, associated score and foreground colour for the text
     """
 
-    file = open("00_colour_list_hex_v3(in).csv", "r")
-    all_colours = list(csv.reader(file, delimiter=","))
-    file.close()
+    # Colours are read from the file once and then kept in memory
+    return get_catalog().get_colours()
 
 
-def get_round_colours():
+def get_round_colours(catalog=None):
     """
     Choose four colours from larger list ensuring that the scores are all different
+    :param catalog: colour catalog to choose from (shared catalog if not given)
     :return: list of colours and score to beat (median of scores)
     """
-    # Retrieve colours from csv file and put them in a list
-    file = open("00_colour_list_hex_v3(in).csv", "r")
-    all_colours = list(csv.reader(file, delimiter=","))
-    file.close()
+    if catalog is None:
+        catalog = get_catalog()
 
-    # Remove the first row
-    all_colours.pop(0)
-
-    round_colours = []
-    colour_scores = []
-
-    # loop until we have four colours with different scores...
-    while len(round_colours) < 4:
-        potential_colour = random.choice(all_colours)
-
-        # Get the score and check it's not a duplicate
-        if potential_colour[1] not in colour_scores:
-            round_colours.append(potential_colour)
-            colour_scores.append(potential_colour[1])
+    # Choose four colours with different scores (colours are grouped by score)
+    round_colours = catalog.choose_round_colours(4)
+    colour_scores = [colour[1] for colour in round_colours]
 
     # Find target score (median)
     int_scores = [int(x) for x in colour_scores]
@@ -0,0 +1,228 @@
+import csv
+import hashlib
+import os
+import random
+import threading
+import time
+from bisect import bisect
+from collections import namedtuple
+from itertools import accumulate
+
+# Colour file lives next to the game files (so the game can be started from anywhere)
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "00_colour_list_hex_v3(in).csv")
+
+# Each colour is (name | score | fg).  Indexing still works like the old csv rows
+# (ie: colour[0] is the name, colour[1] the score and colour[2] the text colour)
+Colour = namedtuple("Colour", ["name", "score", "fg"])
+
+# Seconds between checks of the csv file for changes (the file is only looked
+# at when a round is chosen after this long, so most rounds don't check at all)
+CHECK_INTERVAL = 1.0
+
+
+class ColourCatalog:
+    """
+    Holds every colour from the csv file in memory so that the file
+    is only read once (rather than every round)
+    """
+
+    def __init__(self, file_name=CSV_FILE):
+        """
+        Sets up an empty catalog - colours are loaded the first time they are needed
+        :param file_name: csv file with Name, Score and fg columns
+        """
+        self.file_name = file_name
+        self.colours = []
+        self.loaded = False
+
+        # Colours grouped by score (score -> list of colours with that score)
+        self.score_buckets = {}
+
+        # Buckets and their sizes as lists (score buckets they were made from | buckets | sizes)
+        self.bucket_lists = [None, [], []]
+
+        # Stops two threads from parsing the file at the same time
+        self.load_lock = threading.Lock()
+
+        # Hash of the colours (worked out the first time it is needed)
+        self.fingerprint = None
+
+    def load(self):
+        """
+        Reads the csv file and converts each row into a Colour (score as an integer)
+        :return: list of colours
+        """
+        with open(self.file_name, "r", newline="") as file:
+            all_rows = list(csv.reader(file, delimiter=","))
+
+        # Remove the first row (headings) and skip any blank lines
+        all_colours = [Colour(row[0], int(row[1]), row[2])
+                       for row in all_rows[1:] if row]
+
+        self.set_colours(all_colours)
+        return all_colours
+
+    def set_colours(self, all_colours):
+        """
+        Puts a list of colours into the catalog (grouping them by score)
+        :param all_colours: list of Colour
+        """
+        # Group colours by score so rounds can pick distinct scores directly
+        score_buckets = {}
+        for colour in all_colours:
+            score_buckets.setdefault(colour.score, []).append(colour)
+
+        self.score_buckets = score_buckets
+        self.colours = all_colours
+        self.loaded = True
+
+    def get_colours(self):
+        """
+        Retrieves colours, loading the file the first time only
+        :return: list of colours
+        """
+        if not self.loaded:
+            with self.load_lock:
+                # check again in case another thread loaded it while we waited
+                if not self.loaded:
+                    self.load()
+
+        return self.colours
+
+    def get_score_buckets(self):
+        """
+        Retrieves the colours grouped by score
+        :return: dictionary of score -> list of colours
+        """
+        self.get_colours()
+        return self.score_buckets
+
+    def get_fingerprint(self):
+        """
+        Hash of every colour (name, score and text colour, in order).  Replays
+        use it to check they have the catalog the game was played with.
+        :return: whole number (64 bits)
+        """
+        if self.fingerprint is None:
+            digest = hashlib.sha256()
+            for colour in self.get_colours():
+                digest.update(f"{colour.name},{colour.score},{colour.fg}\n".encode())
+            self.fingerprint = int.from_bytes(digest.digest()[:8], "little")
+
+        return self.fingerprint
+
+    def choose_round_colours(self, how_many=4, rng=random):
+        """
+        Chooses colours which all have different scores.  Each pick is a score
+        (weighted by how many colours share it) followed by one colour with that
+        score, which gives the same odds as picking colours at random and
+        throwing away repeated scores - but never has to retry.
+        :param how_many: number of colours wanted
+        :param rng: random number generator (anything with random)
+        :return: list of colours
+        """
+        score_buckets = self.get_score_buckets()
+
+        if how_many > len(score_buckets):
+            raise ValueError(f"Colour catalog only has {len(score_buckets)} different "
+                             f"scores, can't choose {how_many} colours with different scores")
+
+        # Bucket sizes only change when the catalog is loaded, so work them out once
+        if self.bucket_lists[0] is not score_buckets:
+            buckets = list(score_buckets.values())
+            self.bucket_lists = [score_buckets, buckets, [len(bucket) for bucket in buckets]]
+
+        buckets_left = list(self.bucket_lists[1])
+        weights_left = list(self.bucket_lists[2])
+
+        round_colours = []
+        for item in range(how_many):
+            # Pick a score that hasn't been used yet, then remove it from the list
+            # (one random number picks a colour from all the buckets left - the
+            # bucket it lands in is the score, how far into the bucket is the colour)
+            cumulative = list(accumulate(weights_left))
+            pick = rng.random() * cumulative[-1]
+            position = bisect(cumulative, pick, 0, len(cumulative) - 1)
+            if position > 0:
+                pick -= cumulative[position - 1]
+
+            bucket = buckets_left.pop(position)
+            weights_left.pop(position)
+
+            round_colours.append(bucket[min(int(pick), len(bucket) - 1)])
+
+        return round_colours
+
+
+def get_source_stamp(file_name):
+    """
+    Size and modified time of a file (changes whenever the file is saved)
+    :return: size | modified time in ns (None if the file can't be read)
+    """
+    try:
+        source = os.stat(file_name)
+    except OSError:
+        return None
+    return source.st_size, source.st_mtime_ns
+
+
+def load_shared_catalog():
+    """
+    Loads the csv file into a new catalog (ready to use - nothing is left to
+    be loaded later).  The catalog is read from the compiled binary file,
+    which is rebuilt if the csv file has changed.
+    :return: csv file's stamp before loading | catalog
+    """
+    # imported here as the binary catalog is built on top of this module
+    from C_11_Binary_Catalog import load_catalog
+
+    stamp = get_source_stamp(CSV_FILE)
+    catalog = load_catalog(CSV_FILE)
+    catalog.get_colours()
+    return stamp, catalog
+
+
+# One catalog shared by the whole program (replaced when the csv file changes)
+shared_catalog = None
+shared_catalog_lock = threading.Lock()
+
+# csv file's stamp when the shared catalog was loaded | when to check it next
+shared_catalog_stamp = None
+next_check = 0.0
+
+
+def get_catalog():
+    """
+    Gets the shared colour catalog (creating it on first use).  Once every
+    CHECK_INTERVAL seconds the csv file is checked and, if it has changed, a
+    new catalog is loaded and swapped in.  Games keep the catalog they started
+    with, so a game never sees a half loaded (or different) catalog.  If the
+    new file can't be read (eg: it is still being saved) the old catalog is
+    kept and the file is tried again at the next check.
+    :return: ColourCatalog
+    """
+    global shared_catalog, shared_catalog_stamp, next_check
+
+    if shared_catalog is not None and time.monotonic() < next_check:
+        return shared_catalog
+
+    with shared_catalog_lock:
+        if shared_catalog is None:
+            shared_catalog_stamp, shared_catalog = load_shared_catalog()
+
+        elif time.monotonic() >= next_check:
+            stamp = get_source_stamp(CSV_FILE)
+            if stamp is not None and stamp != shared_catalog_stamp:
+                try:
+                    new_stamp, new_catalog = load_shared_catalog()
+                except (OSError, ValueError, IndexError):
+                    new_stamp, new_catalog = None, None
+
+                # only swap in a complete file which didn't change while it was read
+                if new_catalog is not None and new_stamp == stamp == get_source_stamp(CSV_FILE):
+                    shared_catalog_stamp, shared_catalog = new_stamp, new_catalog
+
+        next_check = time.monotonic() + CHECK_INTERVAL
+
+    return shared_catalog
@@ -0,0 +1,566 @@
+import os
+import random
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+
+from C_06_Colour_Catalog import get_catalog
+from C_15_Leaderboard import get_board
+from C_16_Replay_Log import ReplayLog
+from C_17_Instrumentation import add_count, timed, timer
+
+# Colours in each round (a catalog may allow fewer - every colour needs a different score)
+MIN_COLOURS = 2
+MAX_COLOURS = 64
+
+# Rounds of scores kept by default (the stats use running totals, so this
+# only limits memory - each score list takes 1 byte a round, so 10 KB at most)
+SCORE_LIMIT = 10000
+
+# Result of choosing a colour (colour | score earned | target | won the round?)
+RoundResult = namedtuple("RoundResult", ["colour", "score", "target", "won"])
+
+
+def round_ans(val):
+    """
+    Rounds numbers to nearest integer
+    :param val: number to be rounded.
+    :return: rounded number
+    """
+    var_rounded = (val * 2 + 1) // 2
+    raw_rounded = "{:.0f}".format(var_rounded)
+    return int(raw_rounded)
+
+
+def select(values, position):
+    """
+    Finds the value that would be at 'position' if the values were sorted,
+    without sorting them (quickselect - linear time on average).  The list
+    is rearranged so everything before 'position' is no bigger than it.
+    :param values: list of numbers (changed)
+    :param position: 0 for the smallest, len(values) - 1 for the biggest
+    :return: the value
+    """
+    low = 0
+    high = len(values) - 1
+
+    while low < high:
+        pivot = values[(low + high) // 2]
+
+        # Split into 'no bigger than pivot' (low - j) and 'no smaller' (i - high)
+        i = low
+        j = high
+        while i <= j:
+            while values[i] < pivot:
+                i += 1
+            while values[j] > pivot:
+                j -= 1
+            if i <= j:
+                values[i], values[j] = values[j], values[i]
+                i += 1
+                j -= 1
+
+        if position <= j:
+            high = j
+        elif position >= i:
+            low = i
+        else:
+            # between the two halves, so it equals the pivot
+            break
+
+    return values[position]
+
+
+def median_score(scores):
+    """
+    Works out the score to beat (median, with halves rounded by round_ans())
+    :param scores: list of whole number scores (rearranged)
+    :return: median
+    """
+    middle = len(scores) // 2
+    upper = select(scores, middle)
+    if len(scores) % 2:
+        return upper
+
+    # Everything before the middle is now no bigger than it, so the lower middle is their maximum
+    lower = max(scores[:middle])
+    return round_ans((lower + upper) / 2)
+
+
+@timed("round.generate")
+def get_round_colours(catalog=None, rng=random, how_many=4):
+    """
+    Choose colours from larger list ensuring that the scores are all different
+    :param catalog: colour catalog to choose from (shared catalog if not given)
+    :param rng: random number generator
+    :param how_many: number of colours in the round
+    :return: list of colours, score to beat (median of scores) and highest score
+    """
+    if catalog is None:
+        catalog = get_catalog()
+
+    # Choose colours with different scores (colours are grouped by score)
+    round_colours = catalog.choose_round_colours(how_many, rng)
+    int_scores = [int(colour[1]) for colour in round_colours]
+
+    highest = max(int_scores)
+
+    # Find target score (median)
+    median = median_score(int_scores)
+
+    return round_colours, median, highest
+
+
+def make_seed():
+    """
+    Makes a new 64 bit seed for a game
+    """
+    return int.from_bytes(os.urandom(8), "little")
+
+
+def calculate_stats(rounds_won, user_scores, high_scores):
+    """
+    Works out the numbers shown in the stats dialogue from the full score
+    lists (the lists are not changed)
+    :param rounds_won: number of rounds won
+    :param user_scores: score for each round (0 if the round was lost)
+    :param high_scores: highest possible score for each round
+    :return: list of rounds won, rounds played, success rate, total score,
+    maximum possible score, best score and average score
+    """
+    rounds_played = len(user_scores)
+
+    success_rate = rounds_won / rounds_played * 100
+    total_score = sum(user_scores)
+    max_possible = sum(high_scores)
+
+    best_score = max(user_scores)
+    average_score = total_score / rounds_played
+
+    return [rounds_won, rounds_played, success_rate, total_score, max_possible,
+            best_score, average_score]
+
+
+class ScoreList(Sequence):
+    """
+    Score for each round kept in a typed array (one byte per round while
+    scores are under 256 - it widens itself if a bigger score turns up).
+    Only the latest rounds are kept once the limit is reached (ring buffer).
+    """
+
+    def __init__(self, limit=SCORE_LIMIT):
+        """
+        :param limit: most rounds to keep (None to keep all of them)
+        """
+        self.limit = limit
+        self.scores = array("B")
+
+        # position of the oldest score once the ring buffer is full
+        self.oldest = 0
+
+    def append(self, score):
+        try:
+            self.add(score)
+        except OverflowError:
+            self.scores = array("I", self.scores)
+            self.add(score)
+
+    def extend(self, scores):
+        """
+        Adds a list of scores (in one go while there is room for them)
+        """
+        room = len(scores) if self.limit is None else max(0, self.limit - len(self.scores))
+        fits = scores[:room]
+        if fits and self.scores.typecode == "B" and max(fits) > 0xFF:
+            self.scores = array("I", self.scores)
+        self.scores.extend(fits)
+
+        for score in scores[room:]:
+            self.append(score)
+
+    def add(self, score):
+        if self.limit is None or len(self.scores) < self.limit:
+            self.scores.append(score)
+        else:
+            self.scores[self.oldest] = score
+            self.oldest = (self.oldest + 1) % self.limit
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[count] for count in range(*item.indices(len(self)))]
+
+        if item < 0:
+            item += len(self.scores)
+        if not 0 <= item < len(self.scores):
+            raise IndexError("round index out of range")
+
+        return self.scores[(self.oldest + item) % len(self.scores)]
+
+    def __iter__(self):
+        yield from self.scores[self.oldest:]
+        yield from self.scores[:self.oldest]
+
+
+class StatsAccumulator:
+    """
+    Running totals for the stats dialogue.  They are updated as each round
+    is played, so the stats take the same time to show however long the game is.
+    """
+
+    def __init__(self):
+        self.rounds_played = 0
+        self.rounds_won = 0
+        self.total_score = 0
+        self.best_score = 0
+
+        # sum / biggest of the highest possible score in each round
+        self.max_possible = 0
+        self.highest_round_score = 0
+
+        # rounds where the user scored nothing
+        self.zero_rounds = 0
+
+        # score -> number of rounds with that score (there are only a few
+        # different scores, so this stays small however many rounds are played)
+        self.score_counts = {}
+
+    def add_high_score(self, highest):
+        """
+        Adds the highest possible score of a new round
+        """
+        self.max_possible += highest
+        if highest > self.highest_round_score:
+            self.highest_round_score = highest
+
+    def add_rounds(self, scores, high_scores):
+        """
+        Adds the totals for rounds whose scores are already in score_counts
+        (see GameSession.play_choices())
+        :param scores: user's score for each round (0 if the round was lost)
+        :param high_scores: highest possible score of each round
+        """
+        if not scores:
+            return
+
+        won = len(scores) - scores.count(0)
+        self.rounds_played += len(scores)
+        self.rounds_won += won
+        self.zero_rounds += len(scores) - won
+        self.total_score += sum(scores)
+        self.best_score = max(self.best_score, max(scores))
+        self.max_possible += sum(high_scores)
+        self.highest_round_score = max(self.highest_round_score, max(high_scores))
+
+    def add_result(self, score):
+        """
+        Adds the user's score for a round (0 if the round was lost)
+        """
+        self.rounds_played += 1
+        self.total_score += score
+        self.score_counts[score] = self.score_counts.get(score, 0) + 1
+
+        if score > 0:
+            self.rounds_won += 1
+            if score > self.best_score:
+                self.best_score = score
+        else:
+            self.zero_rounds += 1
+
+    def summary(self):
+        """
+        Works out the numbers shown in the stats dialogue
+        :return: same list as calculate_stats() (all 0 if no rounds have been played)
+        """
+        rounds_played = self.rounds_played
+        if rounds_played == 0:
+            return [0, 0, 0, 0, 0, 0, 0]
+
+        success_rate = self.rounds_won / rounds_played * 100
+        average_score = self.total_score / rounds_played
+
+        return [self.rounds_won, rounds_played, success_rate, self.total_score,
+                self.max_possible, self.best_score, average_score]
+
+    def percentile(self, percent):
+        """
+        Works out a percentile of the round scores exactly from the score counts
+        (nearest rank, so the median of 1, 2, 3, 4 is 2)
+        :param percent: 0 - 100
+        :return: score (None if no rounds have been played)
+        """
+        if not self.rounds_played:
+            return None
+
+        wanted = max(1, -(-self.rounds_played * percent // 100))
+        seen = 0
+        for score in sorted(self.score_counts):
+            seen += self.score_counts[score]
+            if seen >= wanted:
+                return score
+
+        return max(self.score_counts)
+
+    def get_distribution(self):
+        """
+        :return: dictionary of score -> number of rounds (lowest score first)
+        """
+        return dict(sorted(self.score_counts.items()))
+
+
+class GameSession:
+    """
+    Colour Quest game rules without any interface (so games can be
+    played by the GUI, scripts or tests)
+    """
+
+    def __init__(self, rounds_wanted, catalog=None, rng=None, history=None, player="player",
+                 seed=None, keep_log=True, colours_per_round=4, score_limit=SCORE_LIMIT,
+                 hard_mode=False):
+        """
+        Sets up a game
+        :param rounds_wanted: number of rounds to be played
+        :param catalog: colour catalog to choose from (shared catalog if not given -
+        the game keeps the catalog it started with, so changes to the colour file
+        are picked up by the next game)
+        :param rng: random number generator (games with their own generator have
+        no seed, so they can't be replayed)
+        :param history: HistoryStore to record the game in (not recorded if not given)
+        :param player: name the game is recorded under
+        :param seed: seed for the game's random number generator (new one if not given)
+        :param keep_log: False to skip keeping a replay log
+        :param colours_per_round: colours offered each round
+        :param score_limit: most rounds to keep in the score lists (None to keep
+        all of them - the stats use running totals so they always cover every round)
+        :param hard_mode: True if the catalog is every RGB colour (games are
+        recorded on the leaderboard for their mode and colours per round)
+        """
+        if rounds_wanted < 1:
+            raise ValueError("Please choose a whole number more than 0")
+
+        if catalog is None:
+            catalog = get_catalog()
+
+        # Every colour in a round needs a different score, so the catalog
+        # limits how many colours there can be
+        most_colours = min(MAX_COLOURS, len(catalog.get_score_buckets()))
+        if not MIN_COLOURS <= colours_per_round <= most_colours:
+            raise ValueError(f"Please choose {MIN_COLOURS} - {most_colours} colours per round")
+
+        self.rounds_wanted = rounds_wanted
+        self.colours_per_round = colours_per_round
+        self.hard_mode = hard_mode
+        self.board = get_board(hard_mode, colours_per_round)
+        self.score_limit = score_limit
+        self.catalog = catalog
+        self.rng = rng
+        self.seed = None
+        if rng is None:
+            self.seed = make_seed() if seed is None else seed
+        self.keep_log = keep_log
+
+        # Rounds are drawn from the round table (one lookup per round - see
+        # C_20_Round_Table) unless there are too many colours per round for one
+        self.use_round_table = True
+        self.round_table = None
+        self.history = history
+        self.player = player
+        self.start()
+
+    def start(self):
+        """
+        Resets the game so that no rounds have been played
+        """
+        self.rounds_played = 0
+
+        # The seed decides every round's colours, so the seed and the choices are
+        # all a replay needs
+        self.replay_log = None
+        if self.seed is not None:
+            self.rng = random.Random(self.seed)
+            if self.keep_log:
+                self.replay_log = ReplayLog(self.seed, self.rounds_wanted,
+                                            len(self.catalog.get_colours()),
+                                            self.catalog.get_fingerprint(), self.colours_per_round)
+
+        # Next round's colours, target and highest score (chosen early by prefetch_round())
+        self.next_round = None
+
+        # Colours / target for the current round
+        self.round_colour_list = []
+        self.target_score = 0
+        self.highest_score = 0
+        self.round_in_progress = False
+
+        # Score lists (compact arrays) and running totals for stats
+        self.all_scores_list = ScoreList(self.score_limit)
+        self.all_high_score_list = ScoreList(self.score_limit)
+        self.accumulator = StatsAccumulator()
+
+        # Id of the game in the history store (None if it isn't being recorded)
+        self.game_id = None
+        if self.history is not None:
+            self.game_id = self.history.start_game(self.player, self.rounds_wanted, self.board)
+
+    @property
+    def rounds_won(self):
+        """
+        Number of rounds won so far
+        """
+        return self.accumulator.rounds_won
+
+    def is_game_over(self):
+        """
+        Checks whether all the rounds have been played
+        :return: True if the game is over
+        """
+        return self.rounds_played >= self.rounds_wanted and not self.round_in_progress
+
+    def new_round(self):
+        """
+        Chooses the round's colours and works out the score to beat
+        :return: list of colours, score to beat and highest possible score
+        """
+        if self.rounds_played >= self.rounds_wanted:
+            raise ValueError("Game over - no rounds left to play")
+
+        # Starting again would throw the round's colours away (and the replay
+        # log, which only has the choices, would no longer match the game)
+        if self.round_in_progress:
+            raise ValueError("Round in progress - choose a colour first")
+
+        if self.next_round is None:
+            self.prefetch_round()
+
+        self.round_colour_list, median, highest = self.next_round
+        self.next_round = None
+
+        self.rounds_played += 1
+        self.target_score = median
+        self.highest_score = highest
+        self.round_in_progress = True
+
+        # add high score to list for stats...
+        self.all_high_score_list.append(highest)
+        self.accumulator.add_high_score(highest)
+
+        return self.round_colour_list, median, highest
+
+    def prefetch_round(self):
+        """
+        Chooses the next round's colours ahead of time (eg: while the player is
+        looking at the last result) so new_round() only has to hand them over.
+        Rounds are still chosen in order, so seeded games come out the same.
+        """
+        if self.next_round is None and self.rounds_played < self.rounds_wanted:
+            table = self.get_round_table()
+            if table is None:
+                self.next_round = get_round_colours(self.catalog, self.rng, self.colours_per_round)
+            else:
+                with timer("round.draw"):
+                    self.next_round = table.draw_round(self.catalog, self.rng)
+
+    def play_choices(self, choices):
+        """
+        Plays rounds where the choices have already been made (eg: a replay).
+        Rounds from the round table only need their scores, so every round but
+        the last is played without looking colours up or updating the metrics
+        (the last is played as normal, so its colours are there afterwards).
+        :param choices: position of the chosen colour in each round
+        """
+        if len(choices) > self.rounds_wanted - self.rounds_played:
+            raise ValueError("Game over - no rounds left to play")
+
+        table = self.get_round_table()
+        quick_rounds = choices[:-1]
+        if table is None or self.history is not None or self.replay_log is not None \
+                or self.round_in_progress or self.next_round is not None:
+            quick_rounds = []
+
+        draw_scores = table.draw_scores if quick_rounds else None
+        score_counts = self.accumulator.score_counts
+        round_scores = []
+        high_scores = []
+        for choice in quick_rounds:
+            scores, target, highest = draw_scores(self.rng)
+            score = scores[choice]
+            round_score = score if score >= target else 0
+            round_scores.append(round_score)
+            high_scores.append(highest)
+            score_counts[round_score] = score_counts.get(round_score, 0) + 1
+
+        self.rounds_played += len(round_scores)
+        self.all_scores_list.extend(round_scores)
+        self.all_high_score_list.extend(high_scores)
+        self.accumulator.add_rounds(round_scores, high_scores)
+
+        for choice in choices[len(round_scores):]:
+            self.new_round()
+            self.choose(choice)
+
+    def get_round_table(self):
+        """
+        Gets the round table for the game's catalog and colours per round.  It
+        can take a few seconds to make the first time (after that it is read
+        from the disk cache), so the game window loads it on a worker thread.
+        :return: RoundTable (None if the game doesn't use one, or there are too
+        many colours per round to make one)
+        """
+        if self.round_table is None and self.use_round_table:
+            # imported here as the round table is built on top of this module
+            from C_20_Round_Table import get_round_table
+
+            try:
+                self.round_table = get_round_table(self.catalog, self.colours_per_round)
+            except ValueError:
+                self.use_round_table = False
+
+        return self.round_table
+
+    def choose(self, user_choice):
+        """
+        Compares the score of the chosen colour with the target and updates the stats
+        :param user_choice: index of the chosen colour
+        :return: RoundResult
+        """
+        if not self.round_in_progress:
+            raise ValueError("No round in progress - start a new round first")
+
+        colour = self.round_colour_list[user_choice]
+        score = int(colour[1])
+        target = self.target_score
+
+        won = score >= target
+        round_score = score if won else 0
+
+        self.all_scores_list.append(round_score)
+        self.accumulator.add_result(round_score)
+
+        add_count("rounds.played")
+        if won:
+            add_count("rounds.won")
+
+        self.round_in_progress = False
+
+        if self.replay_log is not None:
+            self.replay_log.record(user_choice)
+
+        # Recording only queues the round - it is written to disk in the background
+        if self.history is not None:
+            self.history.record_round(self.game_id, self.player, self.rounds_played,
+                                      self.round_colour_list, user_choice, round_score,
+                                      target, self.highest_score)
+            if self.is_game_over():
+                self.history.finish_game(self.game_id, self.player, self.accumulator, self.board)
+
+        return RoundResult(colour, score, target, won)
+
+    def stats(self):
+        """
+        Gathers the information needed for the stats (from the running totals)
+        :return: list of rounds won, rounds played, success rate, total score,
+        maximum possible score, best score and average score
+        """
+        return self.accumulator.summary()
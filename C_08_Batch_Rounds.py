@@ -0,0 +1,107 @@
+import weakref
+from collections import namedtuple
+
+import numpy as np
+
+from C_06_Colour_Catalog import get_catalog
+
+# Many rounds at once, one row per round
+# (colour indices into the catalog | scores | target score (median) | highest score)
+RoundBatch = namedtuple("RoundBatch", ["colour_indices", "scores", "median", "highest"])
+
+# Catalog -> [colours the arrays were made from, bucket arrays]
+bucket_array_cache = weakref.WeakKeyDictionary()
+
+
+def median_target(sorted_scores):
+    """
+    Works out the score to beat for every round using the same rule as
+    get_round_colours() / round_ans() (ie: median, with halves rounded up)
+    :param sorted_scores: array of scores with one sorted row per round
+    :return: array of targets
+    """
+    k = sorted_scores.shape[1]
+    low = sorted_scores[:, (k - 1) // 2]
+    high = sorted_scores[:, k // 2]
+
+    # round_ans((low + high) / 2) is the same as (low + high + 1) // 2 for whole numbers
+    return (low + high + 1) // 2
+
+
+def get_bucket_arrays(catalog):
+    """
+    Turns the catalog's score buckets into arrays (worked out once per catalog
+    and reused until the catalog's colours change)
+    :param catalog: ColourCatalog
+    :return: bucket scores, bucket sizes, where each bucket starts and
+    catalog positions of the colours grouped by bucket
+    """
+    # Binary catalogs already have their score index stored as arrays
+    if hasattr(catalog, "get_bucket_arrays"):
+        return catalog.get_bucket_arrays()
+
+    all_colours = catalog.get_colours()
+
+    cached = bucket_array_cache.get(catalog)
+    if cached is not None and cached[0] is all_colours:
+        return cached[1]
+
+    # Catalog positions of every colour, grouped by score
+    positions_by_score = {}
+    for count, colour in enumerate(all_colours):
+        positions_by_score.setdefault(colour.score, []).append(count)
+
+    bucket_scores = np.array(list(positions_by_score), dtype=np.int64)
+    bucket_sizes = np.array([len(positions) for positions in positions_by_score.values()],
+                            dtype=np.int64)
+    bucket_starts = np.concatenate(([0], np.cumsum(bucket_sizes)[:-1]))
+    grouped_positions = np.array([count for positions in positions_by_score.values()
+                                  for count in positions], dtype=np.int64)
+
+    arrays = [bucket_scores, bucket_sizes, bucket_starts, grouped_positions]
+    bucket_array_cache[catalog] = [all_colours, arrays]
+    return arrays
+
+
+def generate_rounds(n, k=4, rng=None, catalog=None):
+    """
+    Generates lots of rounds in one go.  Each round has k colours with different
+    scores, picked with the same odds as get_round_colours() (a score is picked
+    with a chance based on how many colours have it, then a random colour with
+    that score).
+    :param n: number of rounds
+    :param k: colours per round
+    :param rng: numpy random Generator (new one if not given)
+    :param catalog: colour catalog to choose from (shared catalog if not given)
+    :return: RoundBatch
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if catalog is None:
+        catalog = get_catalog()
+
+    bucket_scores, bucket_sizes, bucket_starts, grouped_positions = get_bucket_arrays(catalog)
+
+    if k > len(bucket_scores):
+        raise ValueError(f"Colour catalog only has {len(bucket_scores)} different "
+                         f"scores, can't choose {k} colours with different scores")
+
+    # Pick k different buckets per round, weighted by bucket size.  Giving each bucket a
+    # random 'arrival time' (exponential / size) and taking the first k to arrive picks
+    # them in the same order and with the same odds as picking one at a time.
+    arrival = rng.exponential(size=(n, len(bucket_scores))) / bucket_sizes
+    first_k = np.argpartition(arrival, k - 1, axis=1)[:, :k]
+    arrival_order = np.argsort(np.take_along_axis(arrival, first_k, axis=1), axis=1)
+    chosen_buckets = np.take_along_axis(first_k, arrival_order, axis=1)
+
+    # Pick one colour at random from each chosen bucket
+    chosen_sizes = bucket_sizes[chosen_buckets]
+    offsets = (rng.random(size=(n, k)) * chosen_sizes).astype(np.int64)
+    colour_indices = grouped_positions[bucket_starts[chosen_buckets] + offsets]
+
+    scores = bucket_scores[chosen_buckets]
+    sorted_scores = np.sort(scores, axis=1)
+
+    return RoundBatch(colour_indices, scores, median_target(sorted_scores),
+                      sorted_scores[:, -1])
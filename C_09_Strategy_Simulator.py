@@ -0,0 +1,188 @@
+import argparse
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from C_07_Game_Engine import GameSession
+
+# Words that make a colour name sound light / dark (used by the name based strategies)
+WHITE_WORDS = ["white", "snow", "ivory", "seashell", "linen", "lace", "mint",
+               "azure", "alice", "ghost", "honeydew", "lavender", "cornsilk", "lemon"]
+LIGHT_WORDS = ["light", "pale", "pink", "yellow", "gold", "orange", "peach", "wheat"]
+DARK_WORDS = ["dark", "black", "navy", "midnight", "dim", "blue", "slate", "medium"]
+
+
+def pick_random(round_colours, rng):
+    """
+    Picks any colour
+    :return: index of chosen colour
+    """
+    return rng.randrange(len(round_colours))
+
+
+def pick_whitest(round_colours, rng):
+    """
+    Picks the colour whose name sounds the most like white (random if none do)
+    :return: index of chosen colour
+    """
+    for count, colour in enumerate(round_colours):
+        name = colour[0].lower()
+        if any(word in name for word in WHITE_WORDS):
+            return count
+
+    return pick_random(round_colours, rng)
+
+
+def hint_rating(name):
+    """
+    Guesses how light a colour is from its name using the hints (white is best,
+    black is worst, red beats green beats blue).  Tk names ending in 1 - 4 get
+    darker as the number goes up.
+    :param name: colour name
+    :return: rating (higher is better)
+    """
+    name = name.lower()
+    rating = 0
+
+    rating += 3 * sum(word in name for word in WHITE_WORDS)
+    rating += sum(word in name for word in LIGHT_WORDS)
+    rating -= 2 * sum(word in name for word in DARK_WORDS)
+
+    if "red" in name or "pink" in name:
+        rating += 1
+
+    if name[-1:].isdigit():
+        rating -= (int(name[-1]) - 1) / 2
+
+    return rating
+
+
+def pick_by_hint(round_colours, rng):
+    """
+    Picks the colour with the best hint rating
+    :return: index of chosen colour
+    """
+    ratings = [hint_rating(colour[0]) for colour in round_colours]
+    return ratings.index(max(ratings))
+
+
+def pick_oracle(round_colours, rng):
+    """
+    Cheats by looking at the scores and picking the highest
+    :return: index of chosen colour
+    """
+    scores = [int(colour[1]) for colour in round_colours]
+    return scores.index(max(scores))
+
+
+# strategy name | function
+STRATEGIES = {
+    "random": pick_random,
+    "whitest": pick_whitest,
+    "hint": pick_by_hint,
+    "oracle": pick_oracle,
+}
+
+
+def simulate(strategy_name, games, rounds, seed):
+    """
+    Plays lots of games with a single strategy
+    :param strategy_name: key from STRATEGIES
+    :param games: number of games to play
+    :param rounds: rounds per game
+    :param seed: seed for this batch of games (so results can be repeated)
+    :return: totals (games | rounds | rounds won | total score | maximum possible score)
+    """
+    strategy = STRATEGIES[strategy_name]
+    rng = random.Random(seed)
+
+    rounds_won = 0
+    total_score = 0
+    max_possible = 0
+
+    for game_number in range(games):
+        game = GameSession(rounds, rng=rng)
+
+        for round_number in range(rounds):
+            round_colours, median, highest = game.new_round()
+            game.choose(strategy(round_colours, rng))
+
+        rounds_won += game.rounds_won
+        total_score += game.accumulator.total_score
+        max_possible += game.accumulator.max_possible
+
+    return [games, games * rounds, rounds_won, total_score, max_possible]
+
+
+def make_report(strategy_name, totals):
+    """
+    Turns simulation totals into a line of results
+    :return: results string
+    """
+    games, rounds_played, rounds_won, total_score, max_possible = totals
+
+    win_rate = rounds_won / rounds_played * 100
+    mean_score = total_score / games
+    score_vs_max = total_score / max_possible * 100
+
+    return (f"{strategy_name:<8} games: {games:<10} win rate: {win_rate:5.1f}%  "
+            f"mean score: {mean_score:7.2f}  score vs max: {score_vs_max:5.1f}%")
+
+
+def run_simulation(strategy_names, games, rounds, workers, chunk_size, seed, output=sys.stdout):
+    """
+    Splits the games into chunks, plays them on a pool of processes and
+    prints running totals as chunks finish
+    :return: dictionary of strategy name -> totals
+    """
+    all_totals = {name: [0, 0, 0, 0, 0] for name in strategy_names}
+
+    # Every chunk gets its own seed so results are the same however many workers we use
+    jobs = []
+    for name in strategy_names:
+        for chunk_number, first_game in enumerate(range(0, games, chunk_size)):
+            chunk_games = min(chunk_size, games - first_game)
+            chunk_seed = None if seed is None else f"{seed}-{name}-{chunk_number}"
+            jobs.append([name, chunk_games, rounds, chunk_seed])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(simulate, *job): job[0] for job in jobs}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            totals = future.result()
+            all_totals[name] = [old + new for old, new in zip(all_totals[name], totals)]
+            print(make_report(name, all_totals[name]), file=output, flush=True)
+
+    return all_totals
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Simulate Colour Quest strategies")
+    parser.add_argument("-s", "--strategy", action="append", choices=list(STRATEGIES),
+                        help="strategy to test (can be repeated, default is all of them)")
+    parser.add_argument("-g", "--games", type=int, default=10000, help="games per strategy")
+    parser.add_argument("-r", "--rounds", type=int, default=10, help="rounds per game")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="number of processes")
+    parser.add_argument("-c", "--chunk-size", type=int, default=1000,
+                        help="games handed to a process at a time")
+    parser.add_argument("--seed", help="seed (for repeatable results)")
+    options = parser.parse_args(args)
+
+    if options.games < 1 or options.rounds < 1 or options.chunk_size < 1:
+        parser.error("games, rounds and chunk size must be more than 0")
+
+    strategy_names = options.strategy or list(STRATEGIES)
+    all_totals = run_simulation(strategy_names, options.games, options.rounds,
+                                options.workers, options.chunk_size, options.seed)
+
+    print("\nFinal Results")
+    for name in strategy_names:
+        print(make_report(name, all_totals[name]))
+
+
+# main routine
+if __name__ == "__main__":
+    main()
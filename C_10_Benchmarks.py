@@ -0,0 +1,349 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from functools import partial
+
+from C_06_Colour_Catalog import CSV_FILE, ColourCatalog
+from C_07_Game_Engine import StatsAccumulator, calculate_stats
+
+GAME_FOLDER = os.path.dirname(os.path.abspath(__file__))
+CSV_NAME = os.path.basename(CSV_FILE)
+
+# Game versions which have their own copy of round_ans / get_round_colours
+MODULE_VARIANTS = ["B_01_Colour_Game", "C_02_Game_Component", "C_07_Game_Engine"]
+
+# Scripts which do all their work when run (ie: one run is one round)
+SCRIPT_VARIANTS = ["C_03_get_all_colours"]
+
+# Number of rounds produced by each call of the batch generator
+BATCH_SIZE = 10000
+
+
+def write_synthetic_catalog(folder, size, seed=0):
+    """
+    Writes a made up colour file with the same score mix as the real one
+    :param folder: folder to put the file in (file has the same name as the real one)
+    :param size: number of colours
+    :param seed: seed so the same file is made every time
+    :return: path of the new file
+    """
+    rng = random.Random(seed)
+    real_scores = [colour.score for colour in ColourCatalog().get_colours()]
+
+    file_name = os.path.join(folder, CSV_NAME)
+    with open(file_name, "w", newline="") as file:
+        file.write("Name,Score,fg\n")
+        for count in range(size):
+            score = rng.choice(real_scores)
+            fg = "black" if score > 10 else "white"
+            file.write(f"colour{count},{score},{fg}\n")
+
+    return file_name
+
+
+def time_calls(function, time_budget, inner=1, min_samples=3, max_samples=100000):
+    """
+    Calls a function over and over, timing each sample
+    :param function: function to time (no arguments)
+    :param time_budget: seconds to spend (at least min_samples are always taken)
+    :param inner: calls per sample (for very quick functions)
+    :return: list of nanoseconds per call
+    """
+    times = []
+    start = time.perf_counter()
+
+    while len(times) < min_samples or (time.perf_counter() - start < time_budget
+                                       and len(times) < max_samples):
+        sample_start = time.perf_counter_ns()
+        for item in range(inner):
+            function()
+        times.append((time.perf_counter_ns() - sample_start) / inner)
+
+    return times
+
+
+def measure_allocations(function, calls):
+    """
+    Uses tracemalloc to see how much memory a function allocates
+    :return: peak bytes allocated while running and bytes left over per call
+    """
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    for item in range(calls):
+        function()
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak - baseline, (current - baseline) / calls
+
+
+def percentile(sorted_times, percent):
+    """
+    Finds a percentile from a sorted list (nearest rank)
+    """
+    position = min(len(sorted_times) - 1, int(len(sorted_times) * percent / 100))
+    return sorted_times[position]
+
+
+def run_benchmark(benchmark, variant, function, time_budget, catalog_size=None,
+                  history_length=None, inner=1, rounds_per_call=1, alloc_calls=None):
+    """
+    Times a function and measures its allocations
+    :return: dictionary of results
+    """
+    # warm up (so one off loading isn't counted)
+    function()
+
+    times = time_calls(function, time_budget, inner)
+    sorted_times = sorted(times)
+    mean_ns = sum(times) / len(times)
+
+    if alloc_calls is None:
+        alloc_calls = min(len(times) * inner, 1000)
+    peak_bytes, net_bytes = measure_allocations(function, max(1, alloc_calls))
+
+    return {
+        "benchmark": benchmark,
+        "variant": variant,
+        "catalog_size": catalog_size,
+        "history_length": history_length,
+        "calls": len(times) * inner,
+        "rounds_per_sec": rounds_per_call * 1e9 / mean_ns if rounds_per_call else None,
+        "mean_us": mean_ns / 1000,
+        "p50_us": percentile(sorted_times, 50) / 1000,
+        "p90_us": percentile(sorted_times, 90) / 1000,
+        "p99_us": percentile(sorted_times, 99) / 1000,
+        "max_us": sorted_times[-1] / 1000,
+        "peak_alloc_bytes": peak_bytes,
+        "net_alloc_bytes_per_call": net_bytes,
+    }
+
+
+def load_script(script_name, folder):
+    """
+    Compiles a script so it can be run repeatedly (with its prints hidden)
+    :param script_name: module name of the script
+    :param folder: folder to run the script in (where it looks for the colour file)
+    :return: function which runs the script once and returns its variables
+    """
+    with open(os.path.join(GAME_FOLDER, script_name + ".py")) as file:
+        code = compile(file.read(), script_name + ".py", "exec")
+
+    def run_script():
+        namespace = {"__name__": script_name}
+        old_folder = os.getcwd()
+        os.chdir(folder)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                exec(code, namespace)
+        finally:
+            os.chdir(old_folder)
+        return namespace
+
+    return run_script
+
+
+def round_benchmarks(catalog, catalog_size, folder, time_budget):
+    """
+    Benchmarks round generation for every version of the game using one catalog
+    :param catalog: ColourCatalog to use
+    :param catalog_size: label for the results
+    :param folder: folder holding the catalog's csv file
+    :return: list of results
+    """
+    results = []
+
+    # (module versions are given the catalog - the shared one can be swapped
+    # for the csv file's at any time)
+    for module_name in MODULE_VARIANTS:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as error:
+            print(f"Skipping {module_name}: {error}", file=sys.stderr)
+            continue
+
+        results.append(run_benchmark("get_round_colours", module_name,
+                                     partial(module.get_round_colours, catalog), time_budget,
+                                     catalog_size=catalog_size))
+
+    for script_name in SCRIPT_VARIANTS:
+        results.append(run_benchmark("get_round_colours", script_name,
+                                     load_script(script_name, folder), time_budget,
+                                     catalog_size=catalog_size, alloc_calls=3))
+
+    try:
+        import numpy
+        from C_08_Batch_Rounds import generate_rounds
+    except ImportError as error:
+        print(f"Skipping C_08_Batch_Rounds: {error}", file=sys.stderr)
+    else:
+        rng = numpy.random.default_rng(0)
+        results.append(run_benchmark("get_round_colours", "C_08_Batch_Rounds",
+                                     lambda: generate_rounds(BATCH_SIZE, rng=rng, catalog=catalog),
+                                     time_budget, catalog_size=catalog_size,
+                                     rounds_per_call=BATCH_SIZE, alloc_calls=3))
+
+    return results
+
+
+def round_ans_benchmarks(time_budget):
+    """
+    Benchmarks every copy of round_ans on a mix of medians
+    :return: list of results
+    """
+    results = []
+    medians = [(low + high) / 2 for low in range(21) for high in range(low, 21)]
+
+    all_round_ans = []
+    for module_name in MODULE_VARIANTS:
+        try:
+            all_round_ans.append([module_name, importlib.import_module(module_name).round_ans])
+        except ImportError as error:
+            print(f"Skipping {module_name}: {error}", file=sys.stderr)
+
+    for script_name in SCRIPT_VARIANTS:
+        all_round_ans.append([script_name, load_script(script_name, GAME_FOLDER)()["round_ans"]])
+
+    for variant, round_ans in all_round_ans:
+        def round_all():
+            for median in medians:
+                round_ans(median)
+
+        result = run_benchmark("round_ans", variant, round_all, time_budget,
+                               inner=10, rounds_per_call=None)
+
+        # results above are for the whole list of medians, so divide down to one call
+        for key in ["mean_us", "p50_us", "p90_us", "p99_us", "max_us"]:
+            result[key] /= len(medians)
+        result["calls"] *= len(medians)
+        results.append(result)
+
+    return results
+
+
+def stats_benchmarks(time_budget, history_lengths):
+    """
+    Benchmarks the stats calculations for games of different lengths
+    :return: list of results
+    """
+    results = []
+    rng = random.Random(0)
+
+    for length in history_lengths:
+        high_scores = [rng.randint(15, 20) for item in range(length)]
+        user_scores = [rng.choice([0, score]) for score in high_scores]
+        rounds_won = sum(1 for score in user_scores if score)
+
+        results.append(run_benchmark("calculate_stats", "C_07_Game_Engine",
+                                     lambda: calculate_stats(rounds_won, user_scores, high_scores),
+                                     time_budget, history_length=length,
+                                     rounds_per_call=None, alloc_calls=10))
+
+        accumulator = StatsAccumulator()
+        for highest, score in zip(high_scores, user_scores):
+            accumulator.add_high_score(highest)
+            accumulator.add_result(score)
+
+        results.append(run_benchmark("calculate_stats", "StatsAccumulator",
+                                     accumulator.summary, time_budget, history_length=length,
+                                     rounds_per_call=None, alloc_calls=10))
+
+    return results
+
+
+def get_commit():
+    """
+    Finds the current git commit (so results can be compared between commits)
+    :return: commit hash or None
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=GAME_FOLDER,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old_results, new_results):
+    """
+    Prints how each benchmark's mean time changed since an earlier run
+    """
+    def key(result):
+        return (result["benchmark"], result["variant"],
+                result["catalog_size"], result["history_length"])
+
+    old_by_key = {key(result): result for result in old_results["results"]}
+
+    for result in new_results["results"]:
+        old = old_by_key.get(key(result))
+        if old is None:
+            continue
+
+        change = (result["mean_us"] - old["mean_us"]) / old["mean_us"] * 100
+        print(f"{result['benchmark']:<18} {result['variant']:<22} "
+              f"size {str(result['catalog_size'] or result['history_length']):<8} "
+              f"{old['mean_us']:12.2f} us -> {result['mean_us']:12.2f} us ({change:+.1f}%)")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark Colour Quest hot paths")
+    parser.add_argument("--sizes", default="stock,300,10000,1000000",
+                        help="comma separated catalog sizes ('stock' is the real colour file)")
+    parser.add_argument("--history", default="10,1000,100000",
+                        help="comma separated game lengths for the stats benchmark")
+    parser.add_argument("-t", "--time", type=float, default=1.0,
+                        help="seconds to spend on each benchmark")
+    parser.add_argument("-o", "--output", help="file to write the JSON results to")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    options = parser.parse_args(args)
+
+    results = []
+
+    for size in options.sizes.split(","):
+        if size == "stock":
+            catalog = ColourCatalog()
+            results += round_benchmarks(catalog, "stock", GAME_FOLDER, options.time)
+            continue
+
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ColourCatalog(write_synthetic_catalog(folder, int(size)))
+            results += round_benchmarks(catalog, int(size), folder, options.time)
+
+    results += round_ans_benchmarks(options.time)
+    results += stats_benchmarks(options.time, [int(length) for length in options.history.split(",")])
+
+    all_results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    output = json.dumps(all_results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if options.compare:
+        with open(options.compare) as file:
+            compare_results(json.load(file), all_results)
+
+
+# main routine
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+
+from C_06_Colour_Catalog import CSV_FILE, Colour, ColourCatalog
+
+# File layout (all numbers in the machine's byte order, sections padded to 4 bytes)
+#   header
+#   scores          uint16 x colours
+#   fg ids          uint8  x colours   (position in the fg table)
+#   name offsets    uint32 x colours + 1
+#   index scores    uint16 x scores    (every different score)
+#   index starts    uint32 x scores + 1
+#   index colours   uint32 x colours   (colour positions grouped by score)
+#   fg offsets      uint32 x fg + 1
+#   fg text / names (utf-8)
+MAGIC = b"CQCATLG1"
+BYTE_ORDER = sys.byteorder.encode()[:1]
+
+# magic | byte order | source size | source modified time | colours | scores | fg colours | text size
+HEADER = struct.Struct("<8sc3xQqIIII")
+
+
+def get_binary_file(csv_file):
+    """
+    Works out where the compiled version of a csv file is kept
+    :param csv_file: csv colour file
+    :return: binary file name (next to the csv file)
+    """
+    return os.path.splitext(csv_file)[0] + ".cqcat"
+
+
+def padded(data):
+    """
+    Pads bytes with zeros so the next section starts on a 4 byte boundary
+    """
+    return data + bytes(-len(data) % 4)
+
+
+def compile_catalog(csv_file=CSV_FILE, binary_file=None):
+    """
+    Compiles a csv colour file into the binary format.  The new file is
+    written next to the old one and swapped in so readers never see half a file.
+    :param csv_file: csv colour file (always the source of truth)
+    :param binary_file: file to write (next to the csv file if not given)
+    :return: binary file name
+    """
+    if binary_file is None:
+        binary_file = get_binary_file(csv_file)
+
+    source = os.stat(csv_file)
+    all_colours = ColourCatalog(csv_file).load()
+
+    # Text colours are repeated a lot, so store each one once
+    fg_list = []
+    fg_ids = array("B")
+    for colour in all_colours:
+        if colour.fg not in fg_list:
+            fg_list.append(colour.fg)
+        fg_ids.append(fg_list.index(colour.fg))
+
+    if len(fg_list) > 255:
+        raise ValueError("Too many different text colours for the binary catalog")
+
+    try:
+        scores = array("H", [colour.score for colour in all_colours])
+    except OverflowError:
+        raise ValueError("Scores must be between 0 and 65535 for the binary catalog")
+
+    # Score index (colour positions grouped by score)
+    positions_by_score = {}
+    for count, colour in enumerate(all_colours):
+        positions_by_score.setdefault(colour.score, []).append(count)
+
+    index_scores = array("H", positions_by_score)
+    index_starts = array("I", [0])
+    index_colours = array("I")
+    for positions in positions_by_score.values():
+        index_colours.extend(positions)
+        index_starts.append(len(index_colours))
+
+    # String table (text colours first, then colour names)
+    text = bytearray()
+    fg_offsets = array("I", [0])
+    for fg in fg_list:
+        text += fg.encode("utf-8")
+        fg_offsets.append(len(text))
+
+    name_offsets = array("I", [len(text)])
+    for colour in all_colours:
+        text += colour.name.encode("utf-8")
+        name_offsets.append(len(text))
+
+    header = HEADER.pack(MAGIC, BYTE_ORDER, source.st_size, source.st_mtime_ns,
+                         len(all_colours), len(index_scores), len(fg_list), len(text))
+
+    sections = [header, scores.tobytes(), fg_ids.tobytes(), name_offsets.tobytes(),
+                index_scores.tobytes(), index_starts.tobytes(), index_colours.tobytes(),
+                fg_offsets.tobytes(), bytes(text)]
+
+    temp_file = f"{binary_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "wb") as file:
+            for section in sections:
+                file.write(padded(section))
+        os.replace(temp_file, binary_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    return binary_file
+
+
+def is_stale(csv_file, binary_file):
+    """
+    Checks whether the binary file needs rebuilding (missing, made on another
+    kind of machine or made from a different version of the csv file)
+    :return: True if it should be rebuilt
+    """
+    try:
+        with open(binary_file, "rb") as file:
+            header = file.read(HEADER.size)
+        source = os.stat(csv_file)
+    except OSError:
+        return True
+
+    if len(header) < HEADER.size:
+        return True
+
+    magic, byte_order, source_size, source_time = HEADER.unpack(header)[:4]
+    return (magic != MAGIC or byte_order != BYTE_ORDER
+            or source_size != source.st_size or source_time != source.st_mtime_ns)
+
+
+class MappedColours(Sequence):
+    """
+    List-like view of colours which reads each colour from the
+    mapped file when it is asked for
+    """
+
+    def __init__(self, catalog, positions=None):
+        """
+        :param catalog: MappedCatalog the colours belong to
+        :param positions: catalog positions to show (every colour if not given)
+        """
+        self.catalog = catalog
+        self.positions = positions
+
+    def __len__(self):
+        if self.positions is None:
+            return self.catalog.colour_count
+        return len(self.positions)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[count] for count in range(*item.indices(len(self)))]
+
+        if self.positions is None:
+            if item < 0:
+                item += self.catalog.colour_count
+            if not 0 <= item < self.catalog.colour_count:
+                raise IndexError("colour index out of range")
+            return self.catalog.get_colour(item)
+
+        return self.catalog.get_colour(self.positions[item])
+
+
+class MappedCatalog(ColourCatalog):
+    """
+    Colour catalog read straight from a memory mapped binary file, so it
+    opens in the same time however many colours there are and processes
+    using the same file share its memory
+    """
+
+    def __init__(self, binary_file, file_name=CSV_FILE):
+        """
+        :param binary_file: file made by compile_catalog()
+        :param file_name: csv file it was made from
+        """
+        super().__init__(file_name)
+        self.binary_file = binary_file
+        self.mapped_file = None
+
+    def load(self):
+        """
+        Maps the binary file and sets up views of each section
+        :return: list-like view of the colours
+        """
+        with open(self.binary_file, "rb") as file:
+            mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mapped_file)
+        magic, byte_order, source_size, source_time, colour_count, score_count, \
+            fg_count, text_size = HEADER.unpack_from(view)
+
+        if magic != MAGIC or byte_order != BYTE_ORDER:
+            raise ValueError(f"{self.binary_file} is not a colour catalog for this machine")
+
+        position = HEADER.size + (-HEADER.size % 4)
+
+        def next_section(item_count, type_code, item_size):
+            nonlocal position
+            section = view[position:position + item_count * item_size].cast(type_code)
+            position += item_count * item_size
+            position += -position % 4
+            return section
+
+        self.scores = next_section(colour_count, "H", 2)
+        self.fg_ids = next_section(colour_count, "B", 1)
+        self.name_offsets = next_section(colour_count + 1, "I", 4)
+        self.index_scores = next_section(score_count, "H", 2)
+        self.index_starts = next_section(score_count + 1, "I", 4)
+        self.index_colours = next_section(colour_count, "I", 4)
+        fg_offsets = next_section(fg_count + 1, "I", 4)
+        self.text = view[position:position + text_size]
+
+        self.fg_list = [bytes(self.text[fg_offsets[count]:fg_offsets[count + 1]]).decode("utf-8")
+                        for count in range(fg_count)]
+
+        self.mapped_file = mapped_file
+        self.colour_count = colour_count
+
+        # Buckets are views too, so nothing is read until a colour is chosen
+        self.score_buckets = {
+            self.index_scores[count]:
+                MappedColours(self, self.index_colours[self.index_starts[count]:
+                                                       self.index_starts[count + 1]])
+            for count in range(score_count)
+        }
+        self.colours = MappedColours(self)
+        self.loaded = True
+        return self.colours
+
+    def get_colour(self, position):
+        """
+        Reads one colour from the mapped file
+        :param position: colour's position in the catalog
+        :return: Colour
+        """
+        name = bytes(self.text[self.name_offsets[position]:
+                               self.name_offsets[position + 1]]).decode("utf-8")
+        return Colour(name, self.scores[position], self.fg_list[self.fg_ids[position]])
+
+    def get_bucket_arrays(self):
+        """
+        Gives the score index as numpy arrays without copying it (used by
+        the batch round generator)
+        :return: bucket scores, bucket sizes, where each bucket starts and
+        catalog positions of the colours grouped by bucket
+        """
+        import numpy as np
+
+        self.get_colours()
+        bucket_scores = np.frombuffer(self.index_scores, dtype=np.uint16).astype(np.int64)
+        index_starts = np.frombuffer(self.index_starts, dtype=np.uint32).astype(np.int64)
+        grouped_positions = np.frombuffer(self.index_colours, dtype=np.uint32)
+
+        return [bucket_scores, np.diff(index_starts), index_starts[:-1], grouped_positions]
+
+
+def load_catalog(csv_file=CSV_FILE, binary_file=None):
+    """
+    Loads a colour catalog, rebuilding the binary version first if the csv
+    file has changed.  Falls back to reading the csv file if the binary
+    file can't be written (eg: read only folder).
+    :param csv_file: csv colour file
+    :param binary_file: compiled file (next to the csv file if not given)
+    :return: MappedCatalog (or ColourCatalog if the binary file can't be used)
+    """
+    if binary_file is None:
+        binary_file = get_binary_file(csv_file)
+
+    try:
+        if is_stale(csv_file, binary_file):
+            compile_catalog(csv_file, binary_file)
+
+        catalog = MappedCatalog(binary_file, csv_file)
+        catalog.get_colours()
+        return catalog
+
+    except (OSError, ValueError):
+        return ColourCatalog(csv_file)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compile a colour csv file into a binary catalog")
+    parser.add_argument("csv_file", nargs="?", default=CSV_FILE, help="csv colour file")
+    parser.add_argument("-o", "--output", help="binary file to write")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="rebuild even if the binary file is up to date")
+    options = parser.parse_args(args)
+
+    binary_file = options.output or get_binary_file(options.csv_file)
+
+    if options.force or is_stale(options.csv_file, binary_file):
+        compile_catalog(options.csv_file, binary_file)
+        print(f"Compiled {options.csv_file} -> {binary_file}")
+    else:
+        print(f"{binary_file} is up to date")
+
+
+# main routine
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import csv
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+from C_06_Colour_Catalog import CSV_FILE, Colour, ColourCatalog
+
+GAME_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Tk colour names and their red / green / blue values
+TABLE_FILE = os.path.join(GAME_FOLDER, "00_tk_colours.txt")
+
+# Worked out scores are kept here, one file per catalog / colour table / score rules
+CACHE_FOLDER = os.path.join(GAME_FOLDER, "colour_score_cache")
+
+# Change this if the score or fg rules change (so old cached results aren't used)
+SCORE_VERSION = b"score-v1"
+
+HIGHEST_SCORE = 20
+WHITE_HEX = 0xFFFFFF
+
+# Text is black when the colour's luminance is above this (ie: black has
+# more contrast with the colour than white does)
+BLACK_TEXT_LUMINANCE = 0.0525 ** 0.5 - 0.05
+
+memory_cache = {}
+colour_tables = {}
+
+
+def normalise_name(name):
+    """
+    Tk ignores case and spaces in colour names (so 'Alice Blue' is 'aliceblue')
+    """
+    return name.lower().replace(" ", "")
+
+
+def load_colour_table(table_file=TABLE_FILE):
+    """
+    Reads the colour table (once per file)
+    :param table_file: file with 'red green blue name' on each line
+    :return: dictionary of normalised name -> [red, green, blue]
+    """
+    if table_file not in colour_tables:
+        table = {}
+        with open(table_file, "r") as file:
+            for line in file:
+                if line.startswith("!") or not line.strip():
+                    continue
+
+                parts = line.split()
+                table[normalise_name(" ".join(parts[3:]))] = [int(x) for x in parts[:3]]
+
+        colour_tables[table_file] = table
+
+    return colour_tables[table_file]
+
+
+def get_rgb(names, table):
+    """
+    Looks up the red, green and blue values of each colour
+    :param names: list of colour names (or hex codes such as #ff8000)
+    :param table: colour table from load_colour_table()
+    :return: array with a [red, green, blue] row per colour
+    """
+    all_rgb = np.empty((len(names), 3), dtype=np.int64)
+    unknown = []
+
+    for count, name in enumerate(names):
+        key = normalise_name(name)
+        rgb = table.get(key)
+
+        if rgb is None and key.startswith("#") and len(key) == 7:
+            try:
+                rgb = [int(key[1:3], 16), int(key[3:5], 16), int(key[5:7], 16)]
+            except ValueError:
+                rgb = None
+
+        if rgb is None:
+            unknown.append(name)
+        else:
+            all_rgb[count] = rgb
+
+    if unknown:
+        raise ValueError(f"Unknown colour names: {', '.join(unknown[:10])}"
+                         + (" ..." if len(unknown) > 10 else ""))
+
+    return all_rgb
+
+
+def score_rgb(all_rgb):
+    """
+    Works out the score and text colour for every colour in one go.  The score
+    is the colour's hex code as a fraction of white (#FFFFFF) out of 20, rounded
+    like round_ans().  The text colour is whichever of black and white is easier
+    to read on the colour.
+    :param all_rgb: array with a [red, green, blue] row per colour
+    :return: array of scores and array which is True where the text should be black
+    """
+    hex_values = (all_rgb[:, 0] << 16) | (all_rgb[:, 1] << 8) | all_rgb[:, 2]
+
+    # round_ans(hex / WHITE_HEX * 20) using whole numbers only
+    scores = (hex_values * HIGHEST_SCORE * 2 + WHITE_HEX) // (WHITE_HEX * 2)
+
+    # relative luminance (how bright the colour looks)
+    channels = all_rgb / 255
+    linear = np.where(channels <= 0.04045, channels / 12.92, ((channels + 0.055) / 1.055) ** 2.4)
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+
+    return scores, luminance >= BLACK_TEXT_LUMINANCE
+
+
+def make_colours(names, scores, black_text):
+    """
+    Puts names, scores and text colours together
+    :return: list of Colour
+    """
+    return [Colour(name, int(score), "black" if black else "white")
+            for name, score, black in zip(names, scores.tolist(), black_text.tolist())]
+
+
+def compute_colours(names, table_file=TABLE_FILE):
+    """
+    Works out the score and text colour for a list of colour names
+    :return: list of Colour
+    """
+    all_rgb = get_rgb(names, load_colour_table(table_file))
+    scores, black_text = score_rgb(all_rgb)
+
+    return make_colours(names, scores, black_text)
+
+
+def get_cache_key(csv_file, table_file):
+    """
+    Makes a key from the contents of the catalog and colour table
+    :return: hex digest
+    """
+    digest = hashlib.sha256(SCORE_VERSION)
+    for file_name in [table_file, csv_file]:
+        with open(file_name, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def score_catalog(csv_file=CSV_FILE, table_file=TABLE_FILE, use_cache=True):
+    """
+    Works out the score and text colour of every colour in a catalog.  Results are
+    cached (in memory and on disk) using the catalog's contents, so a catalog is
+    only scored again if it (or the colour table) changes.
+    :param csv_file: colour catalog
+    :param table_file: colour table
+    :param use_cache: False to always work the scores out again
+    :return: list of Colour with worked out scores and text colours
+    """
+    names = [colour.name for colour in ColourCatalog(csv_file).load()]
+    key = get_cache_key(csv_file, table_file)
+    cache_file = os.path.join(CACHE_FOLDER, key + ".npz")
+
+    if use_cache:
+        if key in memory_cache:
+            scores, black_text = memory_cache[key]
+        elif os.path.exists(cache_file):
+            with np.load(cache_file) as cached:
+                scores, black_text = cached["scores"], cached["black_text"]
+        else:
+            scores = None
+
+        if scores is not None and len(scores) == len(names):
+            memory_cache[key] = [scores, black_text]
+            return make_colours(names, scores, black_text)
+
+    scores, black_text = score_rgb(get_rgb(names, load_colour_table(table_file)))
+    memory_cache[key] = [scores, black_text]
+
+    if use_cache:
+        try:
+            os.makedirs(CACHE_FOLDER, exist_ok=True)
+            temp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+            np.savez(temp_file, scores=scores, black_text=black_text)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            # caching is only to save time, so carry on without it
+            pass
+
+    return make_colours(names, scores, black_text)
+
+
+def check_catalog(csv_file=CSV_FILE, table_file=TABLE_FILE):
+    """
+    Compares the scores / text colours in a catalog with the worked out ones
+    :return: list of score problems and list of text colour differences
+    (name | catalog value | worked out value)
+    """
+    listed = ColourCatalog(csv_file).load()
+    worked_out = score_catalog(csv_file, table_file)
+
+    score_problems = []
+    fg_differences = []
+    for old, new in zip(listed, worked_out):
+        if old.score != new.score:
+            score_problems.append([old.name, old.score, new.score])
+        if old.fg != new.fg:
+            fg_differences.append([old.name, old.fg, new.fg])
+
+    return score_problems, fg_differences
+
+
+def write_catalog(all_colours, csv_file):
+    """
+    Writes colours to a csv file in the same format as the colour list
+    """
+    with open(csv_file, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Name", "Score", "fg"])
+        writer.writerows(all_colours)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Work out colour scores from their hex codes")
+    parser.add_argument("action", choices=["check", "regenerate", "table"],
+                        help="check a catalog, regenerate its scores, "
+                             "or make a catalog of every Tk colour")
+    parser.add_argument("csv_file", nargs="?", default=CSV_FILE, help="csv colour file")
+    parser.add_argument("-o", "--output", help="file to write (regenerate / table)")
+    parser.add_argument("--keep-fg", action="store_true",
+                        help="keep the catalog's text colours when regenerating")
+    options = parser.parse_args(args)
+
+    if options.action == "check":
+        score_problems, fg_differences = check_catalog(options.csv_file)
+        for name, listed, worked_out in score_problems:
+            print(f"{name}: score is {listed}, should be {worked_out}")
+        print(f"{len(score_problems)} score problems, "
+              f"{len(fg_differences)} text colours differ from the suggested ones")
+        sys.exit(1 if score_problems else 0)
+
+    output = options.output or options.csv_file
+
+    if options.action == "regenerate":
+        all_colours = score_catalog(options.csv_file)
+        if options.keep_fg:
+            listed = ColourCatalog(options.csv_file).load()
+            all_colours = [new._replace(fg=old.fg) for old, new in zip(listed, all_colours)]
+    else:
+        if not options.output:
+            parser.error("table needs an output file (-o)")
+
+        # one entry per colour (the table lists most colours with and without spaces)
+        names = {}
+        with open(TABLE_FILE, "r") as file:
+            for line in file:
+                if not line.startswith("!") and line.strip():
+                    name = " ".join(line.split()[3:])
+                    names.setdefault(normalise_name(name), name)
+        all_colours = compute_colours(list(names.values()))
+
+    write_catalog(all_colours, output)
+    print(f"Wrote {len(all_colours)} colours to {output}")
+
+
+# main routine
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import secrets
+import struct
+import sys
+import time
+
+from C_06_Colour_Catalog import CHECK_INTERVAL, get_catalog
+from C_07_Game_Engine import MAX_COLOURS, MIN_COLOURS, GameSession
+from C_14_History_Store import HistoryStore
+from C_19_RGB_Catalog import get_rgb_catalog
+from C_20_Round_Table import preload_round_tables
+
+# Added to the client's key to make the WebSocket handshake reply (from the WebSocket standard)
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+STATUS_TEXT = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request",
+               404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+               413: "Payload Too Large", 503: "Service Unavailable"}
+
+# Biggest request body we accept (requests are tiny JSON objects)
+MAX_BODY = 64 * 1024
+
+# Rounds of score history kept per game (the stats use running totals, so
+# this only limits memory for very long games)
+SCORE_LIMIT = 1000
+
+
+class RequestError(Exception):
+    """
+    Error which is sent back to the client (status code | message)
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def round_details(game_id, game):
+    """
+    Describes the current round (scores are not sent so players can't cheat).
+    Hard mode colours have no name to show (like the game window, which
+    leaves its buttons blank) - just the colour to draw and its position.
+    :return: dictionary ready to be turned into JSON
+    """
+    if game.hard_mode:
+        colours = [{"index": index, "bg": colour[0], "fg": colour[2]}
+                   for index, colour in enumerate(game.round_colour_list)]
+    else:
+        colours = [{"name": colour[0], "fg": colour[2]} for colour in game.round_colour_list]
+
+    return {
+        "game_id": game_id,
+        "round": game.rounds_played,
+        "rounds_wanted": game.rounds_wanted,
+        "target": game.target_score,
+        "colours": colours,
+    }
+
+
+def get_content_length(headers):
+    """
+    Reads the size of the request body from its headers
+    :return: size in bytes (0 if there is no body)
+    """
+    text = headers.get("content-length", "")
+    if not text:
+        return 0
+
+    if not (text.isascii() and text.isdigit()):
+        raise RequestError(400, "Content-Length must be a whole number")
+
+    length = int(text)
+    if length > MAX_BODY:
+        raise RequestError(413, "Request too big")
+    return length
+
+
+def stats_details(game_id, game):
+    """
+    Describes the game's stats (same numbers as the Stats dialogue)
+    :return: dictionary ready to be turned into JSON
+    """
+    details = {"game_id": game_id, "rounds_played": game.accumulator.rounds_played}
+
+    if game.accumulator.rounds_played > 0:
+        rounds_won, rounds_played, success_rate, total_score, max_possible, best_score, \
+            average_score = game.stats()
+        details.update(rounds_won=rounds_won, success_rate=success_rate,
+                       total_score=total_score, max_possible=max_possible,
+                       best_score=best_score, average_score=average_score,
+                       median_score=game.accumulator.percentile(50),
+                       percentile_90=game.accumulator.percentile(90),
+                       score_counts={str(score): rounds for score, rounds
+                                     in game.accumulator.get_distribution().items()})
+
+    # The seed decides every round, so it is only given out once the game is over
+    if game.is_game_over() and game.seed is not None:
+        details["seed"] = f"{game.seed:016x}"
+
+    return details
+
+
+class GameServer:
+    """
+    Hosts lots of Colour Quest games at once.  Games are played with JSON
+    requests over HTTP (or messages over a WebSocket) and every game uses
+    the same shared, read only colour catalog.
+    """
+
+    def __init__(self, max_games=100000, idle_timeout=3600, history=None):
+        """
+        :param max_games: most games kept at once
+        :param idle_timeout: seconds before an unused game is removed
+        :param history: HistoryStore to record games in (not recorded if not given)
+        """
+        self.max_games = max_games
+        self.idle_timeout = idle_timeout
+        self.history = history
+
+        # game id -> [GameSession, time last used]
+        self.games = {}
+
+        # game id -> set of WebSocket writers which want to hear about the game
+        self.subscribers = {}
+
+        # hard mode? -> catalog new games use (only swapped for a new catalog once
+        # its round tables are loaded, so requests never wait for a table)
+        self.catalogs = {}
+
+    def get_game(self, game_id):
+        """
+        Finds a game (and marks it as just used)
+        :return: GameSession
+        """
+        entry = self.games.get(game_id)
+        if entry is None:
+            raise RequestError(404, f"No game with id {game_id}")
+
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    def remove_idle_games(self):
+        """
+        Removes games which haven't been used for a while
+        :return: number of games removed
+        """
+        oldest_allowed = time.monotonic() - self.idle_timeout
+        idle_ids = [game_id for game_id, entry in self.games.items() if entry[1] < oldest_allowed]
+
+        for game_id in idle_ids:
+            del self.games[game_id]
+            self.subscribers.pop(game_id, None)
+
+        return len(idle_ids)
+
+    def new_game(self, rounds, player="player", hard_mode=False, colours_per_round=4):
+        """
+        Starts a game and its first round
+        :param rounds: number of rounds wanted
+        :param player: name the game is recorded under
+        :param hard_mode: True to use every RGB colour instead of the named colours
+        :param colours_per_round: colours offered each round
+        :return: first round details
+        """
+        if not isinstance(rounds, int) or isinstance(rounds, bool) or rounds < 1:
+            raise RequestError(400, "Please choose a whole number more than 0")
+
+        if not isinstance(player, str) or not 0 < len(player) <= 100:
+            raise RequestError(400, "Player name must be 1 - 100 characters")
+
+        if not isinstance(hard_mode, bool):
+            raise RequestError(400, "hard_mode must be true or false")
+
+        catalog = self.catalogs.get(hard_mode)
+        if catalog is None:
+            catalog = get_rgb_catalog() if hard_mode else get_catalog()
+        most_colours = min(MAX_COLOURS, len(catalog.get_score_buckets()))
+        if not isinstance(colours_per_round, int) or isinstance(colours_per_round, bool) \
+                or not MIN_COLOURS <= colours_per_round <= most_colours:
+            raise RequestError(400, f"Please choose {MIN_COLOURS} - {most_colours} "
+                                    f"colours per round")
+
+        if len(self.games) >= self.max_games and not self.remove_idle_games():
+            raise RequestError(503, "Too many games - please try again later")
+
+        game_id = secrets.token_urlsafe(9)
+        # The game keeps this catalog (changes to the colour list are picked up by new games).
+        # No replay log is kept - the seed is given out at the end, and the
+        # choices are in the history store, so it would only use memory.
+        game = GameSession(rounds, catalog=catalog, history=self.history, player=player,
+                           hard_mode=hard_mode, keep_log=False,
+                           colours_per_round=colours_per_round, score_limit=SCORE_LIMIT)
+        self.games[game_id] = [game, time.monotonic()]
+
+        game.new_round()
+        return round_details(game_id, game)
+
+    def new_round(self, game_id, sender=None):
+        """
+        Starts the next round of a game
+        :return: round details
+        """
+        game = self.get_game(game_id)
+
+        try:
+            game.new_round()
+        except ValueError as error:
+            raise RequestError(409, str(error))
+
+        details = round_details(game_id, game)
+        self.push(game_id, "round", details, sender)
+        return details
+
+    def choose(self, game_id, choice, sender=None):
+        """
+        Picks one of the round's colours
+        :param choice: position of the chosen colour
+        :return: round result
+        """
+        game = self.get_game(game_id)
+
+        if not isinstance(choice, int) or isinstance(choice, bool) \
+                or not 0 <= choice < len(game.round_colour_list):
+            raise RequestError(400, "Choice must be the position of one of the round's colours")
+
+        try:
+            result = game.choose(choice)
+        except ValueError as error:
+            raise RequestError(409, str(error))
+
+        details = {
+            "game_id": game_id,
+            "round": game.rounds_played,
+            "colour": result.colour[0],
+            "score": result.score,
+            "target": result.target,
+            "won": result.won,
+            "rounds_won": game.rounds_won,
+            "game_over": game.is_game_over(),
+        }
+        self.push(game_id, "result", details, sender)
+        return details
+
+    def stats(self, game_id):
+        """
+        :return: stats for a game
+        """
+        return stats_details(game_id, self.get_game(game_id))
+
+    def end_game(self, game_id, sender=None):
+        """
+        Removes a game (and tells anyone watching it)
+        """
+        self.get_game(game_id)
+        del self.games[game_id]
+        self.push(game_id, "ended", {"game_id": game_id}, sender)
+        self.subscribers.pop(game_id, None)
+        return None
+
+    def push(self, game_id, event, details, sender=None):
+        """
+        Sends an event to every WebSocket watching a game (apart from the
+        one which caused it, as that gets a reply instead)
+        """
+        writers = self.subscribers.get(game_id)
+        if not writers:
+            return
+
+        frame = make_frame(json.dumps({"event": event, **details}).encode())
+        for writer in list(writers):
+            if writer.is_closing():
+                writers.discard(writer)
+            elif writer is not sender:
+                writer.write(frame)
+
+    def route(self, method, path, body):
+        """
+        Works out which action a request is for
+        :return: status code and reply (None for no reply)
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+
+        if parts == ["games"]:
+            if method != "POST":
+                raise RequestError(405, "Use POST to start a game")
+            return 201, self.new_game(body.get("rounds"), body.get("player", "player"),
+                                      body.get("hard_mode", False),
+                                      body.get("colours_per_round", 4))
+
+        if len(parts) >= 2 and parts[0] == "games":
+            game_id = parts[1]
+            action = parts[2:]
+
+            if action == [] and method == "GET":
+                return 200, round_details(game_id, self.get_game(game_id))
+            if action == [] and method == "DELETE":
+                return 204, self.end_game(game_id)
+            if action == ["rounds"] and method == "POST":
+                return 201, self.new_round(game_id)
+            if action == ["choice"] and method == "POST":
+                return 200, self.choose(game_id, body.get("choice"))
+            if action == ["stats"] and method == "GET":
+                return 200, self.stats(game_id)
+
+        raise RequestError(404, f"Nothing at {method} {path}")
+
+    def handle_message(self, message, writer):
+        """
+        Carries out an action sent over a WebSocket
+        (eg: {"action": "choose", "game_id": "...", "choice": 2})
+        :return: reply
+        """
+        action = message.get("action")
+        game_id = message.get("game_id")
+
+        if action == "new_game":
+            details = self.new_game(message.get("rounds"), message.get("player", "player"),
+                                    message.get("hard_mode", False),
+                                    message.get("colours_per_round", 4))
+            self.subscribers.setdefault(details["game_id"], set()).add(writer)
+            return {"event": "round", **details}
+        if action == "watch":
+            self.get_game(game_id)
+            self.subscribers.setdefault(game_id, set()).add(writer)
+            return {"event": "watching", "game_id": game_id}
+        if action == "new_round":
+            return {"event": "round", **self.new_round(game_id, writer)}
+        if action == "choose":
+            return {"event": "result", **self.choose(game_id, message.get("choice"), writer)}
+        if action == "stats":
+            return {"event": "stats", **self.stats(game_id)}
+        if action == "end_game":
+            self.end_game(game_id, writer)
+            return {"event": "ended", "game_id": game_id}
+
+        raise RequestError(400, f"Unknown action {action}")
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves one connection (keep alive HTTP requests or a WebSocket)
+        """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, path, version = lines[0].split(" ")
+                except ValueError:
+                    send_reply(writer, 400, {"error": "Bad request line"}, keep_alive=False)
+                    break
+
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self.serve_websocket(reader, writer, headers, path)
+                    break
+
+                keep_alive = headers.get("connection", "").lower() != "close" \
+                    and version == "HTTP/1.1"
+
+                try:
+                    length = get_content_length(headers)
+                except RequestError as error:
+                    # the body can't be skipped, so the connection is closed
+                    send_reply(writer, error.status, {"error": str(error)}, keep_alive=False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b""
+
+                try:
+                    body = json.loads(raw_body) if raw_body else {}
+                    if not isinstance(body, dict):
+                        raise RequestError(400, "Request body must be a JSON object")
+                    status, reply = self.route(method, path, body)
+                except json.JSONDecodeError:
+                    status, reply = 400, {"error": "Request body is not valid JSON"}
+                except RequestError as error:
+                    status, reply = error.status, {"error": str(error)}
+
+                send_reply(writer, status, reply, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_websocket(self, reader, writer, headers, path):
+        """
+        Completes the WebSocket handshake, then handles JSON messages until the
+        client disconnects.  Connecting to /games/<id>/events watches that game.
+        """
+        key = headers.get("sec-websocket-key", "").encode()
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+        parts = [part for part in path.split("/") if part]
+        watched = set()
+        if len(parts) == 3 and parts[0] == "games" and parts[2] == "events":
+            if parts[1] in self.games:
+                self.subscribers.setdefault(parts[1], set()).add(writer)
+                watched.add(parts[1])
+
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+
+                if opcode == 0x8:
+                    writer.write(make_frame(payload[:2], opcode=0x8))
+                    break
+                if opcode == 0x9:
+                    writer.write(make_frame(payload, opcode=0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+
+                try:
+                    message = json.loads(payload)
+                    if not isinstance(message, dict):
+                        raise RequestError(400, "Messages must be JSON objects")
+                    reply = self.handle_message(message, writer)
+                except json.JSONDecodeError:
+                    reply = {"event": "error", "status": 400, "error": "Message is not valid JSON"}
+                except RequestError as error:
+                    reply = {"event": "error", "status": error.status, "error": str(error)}
+
+                if reply.get("game_id"):
+                    watched.add(reply["game_id"])
+                writer.write(make_frame(json.dumps(reply).encode()))
+                await writer.drain()
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for game_id in watched:
+                writers = self.subscribers.get(game_id)
+                if writers is not None:
+                    writers.discard(writer)
+
+    async def remove_idle_games_forever(self):
+        """
+        Regularly clears out games nobody is playing any more
+        """
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            self.remove_idle_games()
+
+    def load_catalogs(self):
+        """
+        Gets the latest catalogs and loads their round tables (tables are made
+        once and then read from the disk cache, but that can still take a few
+        seconds, so the server does this on a worker thread)
+        :return: dictionary of hard mode? -> catalog
+        """
+        catalogs = {False: get_catalog(), True: get_rgb_catalog()}
+        for catalog in catalogs.values():
+            preload_round_tables(catalog)
+        return catalogs
+
+    async def update_catalogs_forever(self):
+        """
+        Regularly picks up changes to the colour file (new games get the new
+        catalog once its round tables are ready)
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            try:
+                self.catalogs = await loop.run_in_executor(None, self.load_catalogs)
+            except Exception as error:
+                print(f"Colour catalog couldn't be updated: {error}", file=sys.stderr)
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        """
+        Runs the server until it is cancelled
+        """
+        # Load the catalogs and their round tables before the first request needs them
+        self.catalogs = await asyncio.get_running_loop().run_in_executor(None, self.load_catalogs)
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        cleaner = asyncio.create_task(self.remove_idle_games_forever())
+        updater = asyncio.create_task(self.update_catalogs_forever())
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            cleaner.cancel()
+            updater.cancel()
+
+
+def send_reply(writer, status, reply, keep_alive=True):
+    """
+    Writes an HTTP response with a JSON body
+    """
+    body = b"" if reply is None else json.dumps(reply).encode()
+    connection = "keep-alive" if keep_alive else "close"
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {connection}\r\n\r\n")
+    writer.write(head.encode() + body)
+
+
+def make_frame(payload, opcode=0x1):
+    """
+    Makes a WebSocket frame (server frames are never masked)
+    """
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return head + payload
+
+
+async def read_frame(reader):
+    """
+    Reads a WebSocket message (joining any continuation frames)
+    :return: opcode and payload
+    """
+    message = b""
+    message_opcode = None
+
+    while True:
+        first, second = await reader.readexactly(2)
+        final = first & 0x80
+        opcode = first & 0x0F
+        length = second & 0x7F
+
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+
+        if length > MAX_BODY:
+            raise ConnectionError("WebSocket message too big")
+
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = bytes(byte ^ mask[count % 4] for count, byte in enumerate(payload))
+
+        # control frames can arrive in the middle of a message
+        if opcode >= 0x8:
+            return opcode, payload
+
+        if message_opcode is None:
+            message_opcode = opcode
+        message += payload
+
+        if final:
+            return message_opcode, message
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Serve Colour Quest games over HTTP / WebSockets")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--max-games", type=int, default=100000, help="most games kept at once")
+    parser.add_argument("--idle-timeout", type=float, default=3600,
+                        help="seconds before an unused game is removed")
+    parser.add_argument("--history", help="SQLite file to record games in")
+    options = parser.parse_args(args)
+
+    history = HistoryStore(options.history) if options.history else None
+    server = GameServer(options.max_games, options.idle_timeout, history)
+    print(f"Serving Colour Quest on http://{options.host}:{options.port}")
+
+    try:
+        asyncio.run(server.serve(options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if history is not None:
+            history.close()
+
+
+# main routine
+if __name__ == "__main__":
+    main()
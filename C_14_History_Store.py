@@ -0,0 +1,331 @@
+import atexit
+import getpass
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from C_15_Leaderboard import DEFAULT_BOARD, LEADERBOARD_SCHEMA, update_leaderboard
+from C_17_Instrumentation import add_count
+
+GAME_FOLDER = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(GAME_FOLDER, "colour_quest_history.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    player TEXT NOT NULL,
+    rounds_wanted INTEGER NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    rounds_played INTEGER NOT NULL DEFAULT 0,
+    rounds_won INTEGER NOT NULL DEFAULT 0,
+    total_score INTEGER NOT NULL DEFAULT 0,
+    max_possible INTEGER NOT NULL DEFAULT 0,
+    best_score INTEGER NOT NULL DEFAULT 0,
+    board TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    round_id INTEGER PRIMARY KEY,
+    game_id TEXT NOT NULL,
+    player TEXT NOT NULL,
+    round_number INTEGER NOT NULL,
+    colours TEXT NOT NULL,
+    scores TEXT NOT NULL,
+    choice INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    highest INTEGER NOT NULL,
+    played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rounds_by_player ON rounds (player, played);
+CREATE INDEX IF NOT EXISTS rounds_by_date ON rounds (played);
+CREATE INDEX IF NOT EXISTS rounds_by_game ON rounds (game_id, round_number);
+CREATE INDEX IF NOT EXISTS games_by_player ON games (player, started);
+CREATE INDEX IF NOT EXISTS games_by_date ON games (started);
+"""
+
+ROUND_COLUMNS = ["round_id", "game_id", "player", "round_number", "colours", "scores",
+                 "choice", "score", "target", "highest", "played"]
+GAME_COLUMNS = ["game_id", "player", "rounds_wanted", "started", "finished", "rounds_played",
+                "rounds_won", "total_score", "max_possible", "best_score", "board"]
+
+
+def get_player_name():
+    """
+    Name used for the person playing on this computer
+    """
+    try:
+        return getpass.getuser()
+    except (KeyError, OSError):
+        return "player"
+
+
+class HistoryStore:
+    """
+    Records every game and round in an SQLite database.  Recording only puts
+    the details in a queue - a background thread writes them in batches - so
+    playing a round never waits for the disk.
+    """
+
+    def __init__(self, db_file=HISTORY_FILE, batch_size=500, flush_interval=0.5):
+        """
+        :param db_file: SQLite database file
+        :param batch_size: most records written in one transaction
+        :param flush_interval: most seconds a record waits before being written
+        """
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.write_queue = queue.Queue()
+        self.stopping = False
+
+        # Records which couldn't be written and the last thing that went wrong
+        # (also counted in the metrics as history.lost_records)
+        self.lost_records = 0
+        self.last_error = None
+
+        # Create the tables before anything is recorded (so queries work straight away)
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.executescript(LEADERBOARD_SCHEMA)
+        connection.close()
+
+        self.writer = threading.Thread(target=self.write_forever, name="history-writer",
+                                       daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        """
+        Opens a connection in WAL mode (so reading doesn't block writing)
+        """
+        connection = sqlite3.connect(self.db_file, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # Recording (called from the game - only adds to the queue)
+
+    def start_game(self, player, rounds_wanted, board=DEFAULT_BOARD):
+        """
+        Records the start of a game
+        :param board: leaderboard for the kind of game (see C_15_Leaderboard.get_board)
+        :return: game id
+        """
+        game_id = uuid.uuid4().hex
+        self.write_queue.put(["game", game_id, player, rounds_wanted, time.time(), board])
+        return game_id
+
+    def record_round(self, game_id, player, round_number, round_colours, choice,
+                     score, target, highest):
+        """
+        Records a finished round
+        :param round_colours: colours offered (name | score | fg)
+        :param choice: position of the chosen colour
+        :param score: points earned (0 if the round was lost)
+        """
+        self.write_queue.put(["round", game_id, player, round_number, round_colours, choice,
+                              score, target, highest, time.time()])
+
+    def finish_game(self, game_id, player, accumulator, board=DEFAULT_BOARD):
+        """
+        Records the final totals of a game (and adds them to the leaderboards)
+        :param accumulator: StatsAccumulator for the game
+        :param board: leaderboard for the kind of game
+        """
+        self.write_queue.put(["finish", game_id, player, time.time(), accumulator.rounds_played,
+                              accumulator.rounds_won, accumulator.total_score,
+                              accumulator.max_possible, accumulator.best_score, board])
+
+    # Writing (background thread)
+
+    def write_forever(self):
+        """
+        Takes records off the queue and writes them in batches
+        """
+        connection = self.connect()
+
+        while True:
+            try:
+                batch = [self.write_queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                if self.stopping:
+                    break
+                continue
+
+            # Collect whatever else is waiting (up to the batch size)
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.write_batch(connection, batch)
+            except Exception:
+                # Write the records one at a time so one bad record doesn't lose
+                # the rest of the batch (nothing is allowed to stop the writer)
+                self.write_each(connection, batch)
+            finally:
+                for item in batch:
+                    self.write_queue.task_done()
+
+        connection.close()
+
+    def write_each(self, connection, batch):
+        """
+        Writes records one at a time, keeping track of any which can't be written
+        """
+        for record in batch:
+            try:
+                self.write_batch(connection, [record])
+            except Exception as error:
+                self.lost_records += 1
+                self.last_error = error
+                add_count("history.lost_records")
+
+    def write_batch(self, connection, batch):
+        """
+        Writes a batch of records in one transaction
+        """
+        new_games = []
+        new_rounds = []
+        finished_games = []
+
+        for record in batch:
+            if record[0] == "game":
+                new_games.append(record[1:])
+            elif record[0] == "round":
+                game_id, player, round_number, round_colours, choice, score, target, \
+                    highest, played = record[1:]
+                new_rounds.append([game_id, player, round_number,
+                                   json.dumps([colour[0] for colour in round_colours]),
+                                   json.dumps([int(colour[1]) for colour in round_colours]),
+                                   choice, score, target, highest, played])
+            else:
+                finished_games.append(record[1:])
+
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO games (game_id, player, rounds_wanted, "
+                                   "started, board) VALUES (?, ?, ?, ?, ?)", new_games)
+            connection.executemany("INSERT INTO rounds (game_id, player, round_number, colours, "
+                                   "scores, choice, score, target, highest, played) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", new_rounds)
+            connection.executemany("UPDATE games SET finished = ?, rounds_played = ?, "
+                                   "rounds_won = ?, total_score = ?, max_possible = ?, "
+                                   "best_score = ? WHERE game_id = ?",
+                                   [record[2:8] + record[:1] for record in finished_games])
+
+            # finished time | board | player | rounds played | rounds won | total score
+            update_leaderboard(connection, [record[2:3] + record[8:9] + record[1:2] + record[3:6]
+                                             for record in finished_games])
+
+    def flush(self):
+        """
+        Waits until everything recorded so far has been written (stops waiting
+        if the background thread has stopped, so this can never hang)
+        """
+        with self.write_queue.all_tasks_done:
+            while self.write_queue.unfinished_tasks and self.writer.is_alive():
+                self.write_queue.all_tasks_done.wait(self.flush_interval)
+
+    def close(self):
+        """
+        Writes anything left and stops the background thread
+        :return: number of records which couldn't be written
+        """
+        self.flush()
+        self.stopping = True
+        self.writer.join()
+        return self.lost_records
+
+    # Queries (safe to call from any thread)
+
+    def query(self, sql, parameters, columns):
+        """
+        Runs a query on its own connection
+        :return: list of dictionaries (column -> value)
+        """
+        connection = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            rows = connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def rounds_for_player(self, player, since=0, until=None, limit=1000):
+        """
+        Rounds a player has played (newest first)
+        :param since: / until: times (seconds since 1970) to look between
+        """
+        until = time.time() + 1 if until is None else until
+        return self.query(f"SELECT {', '.join(ROUND_COLUMNS)} FROM rounds "
+                          "WHERE player = ? AND played >= ? AND played < ? "
+                          "ORDER BY played DESC LIMIT ?",
+                          [player, since, until, limit], ROUND_COLUMNS)
+
+    def rounds_between(self, since, until, limit=1000):
+        """
+        Rounds anyone played between two times (newest first)
+        """
+        return self.query(f"SELECT {', '.join(ROUND_COLUMNS)} FROM rounds "
+                          "WHERE played >= ? AND played < ? ORDER BY played DESC LIMIT ?",
+                          [since, until, limit], ROUND_COLUMNS)
+
+    def games_for_player(self, player, limit=1000):
+        """
+        Games a player has started (newest first)
+        """
+        return self.query(f"SELECT {', '.join(GAME_COLUMNS)} FROM games "
+                          "WHERE player = ? ORDER BY started DESC LIMIT ?",
+                          [player, limit], GAME_COLUMNS)
+
+    def rounds_for_game(self, game_id):
+        """
+        Every round of a game (in order)
+        """
+        return self.query(f"SELECT {', '.join(ROUND_COLUMNS)} FROM rounds "
+                          "WHERE game_id = ? ORDER BY round_number",
+                          [game_id], ROUND_COLUMNS)
+
+
+# One history store shared by the whole program
+shared_store = None
+shared_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """
+    Gets the shared history store (creating it on first use).  Anything
+    still waiting to be written is saved when the program ends.
+    :return: HistoryStore (or None if the database can't be opened)
+    """
+    global shared_store
+
+    if shared_store is None:
+        with shared_store_lock:
+            if shared_store is None:
+                try:
+                    shared_store = HistoryStore()
+                except sqlite3.Error as error:
+                    print(f"Game history won't be saved: {error}", file=sys.stderr)
+                    return None
+                atexit.register(close_shared_store)
+
+    return shared_store
+
+
+def close_shared_store():
+    """
+    Saves anything left in the shared history store, saying (once) if any
+    records couldn't be written
+    """
+    lost_records = shared_store.close()
+    if lost_records:
+        print(f"{lost_records} game history records couldn't be saved "
+              f"(last error: {shared_store.last_error})", file=sys.stderr)
@@ -0,0 +1,238 @@
+import argparse
+import sqlite3
+import time
+
+# Leaderboard totals are kept per player (all time) and per player per day (for
+# 'last few days' leaderboards).  They are updated as each game finishes, so
+# leaderboards never have to go back through the rounds.  Each kind of game
+# (normal / hard mode and colours per round) has its own leaderboard as the
+# scores can't be compared.
+LEADERBOARD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leaderboard_players (
+    board TEXT NOT NULL,
+    player TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    rounds_played INTEGER NOT NULL,
+    rounds_won INTEGER NOT NULL,
+    total_score INTEGER NOT NULL,
+    success_rate REAL NOT NULL,
+    best_game INTEGER NOT NULL,
+    PRIMARY KEY (board, player)
+);
+CREATE TABLE IF NOT EXISTS leaderboard_days (
+    board TEXT NOT NULL,
+    player TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    rounds_played INTEGER NOT NULL,
+    rounds_won INTEGER NOT NULL,
+    total_score INTEGER NOT NULL,
+    best_game INTEGER NOT NULL,
+    PRIMARY KEY (board, day, player)
+);
+CREATE INDEX IF NOT EXISTS leaderboard_players_by_total ON leaderboard_players (board, total_score);
+CREATE INDEX IF NOT EXISTS leaderboard_players_by_success ON leaderboard_players (board, success_rate, rounds_played);
+CREATE INDEX IF NOT EXISTS leaderboard_players_by_best_game ON leaderboard_players (board, best_game);
+CREATE INDEX IF NOT EXISTS finished_games_by_board ON games (board, total_score) WHERE finished IS NOT NULL;
+"""
+
+SECONDS_PER_DAY = 86400
+
+# Leaderboard name | description
+METRICS = {
+    "total_score": "Total Score",
+    "success_rate": "Success Rate",
+    "best_game": "Best Game",
+}
+
+# Leaderboard for games with four named colours per round (the usual game)
+DEFAULT_BOARD = "normal-4"
+
+# Players need to have played this many rounds to be on the success rate leaderboard
+# (otherwise one lucky round puts you at the top)
+MIN_ROUNDS_FOR_SUCCESS = 10
+
+
+def get_day(timestamp):
+    """
+    Day number (days since 1970) of a time
+    """
+    return int(timestamp // SECONDS_PER_DAY)
+
+
+def get_board(hard_mode=False, colours_per_round=4):
+    """
+    Name of the leaderboard for a kind of game (eg: normal-4, hard-8)
+    """
+    return f"{'hard' if hard_mode else 'normal'}-{colours_per_round}"
+
+
+def update_leaderboard(connection, finished_games):
+    """
+    Adds finished games to the leaderboard totals (called by the history
+    store in the same transaction that records the games)
+    :param finished_games: list of [finished time, board, player, rounds played,
+    rounds won, total score]
+    """
+    player_rows = []
+    day_rows = []
+    for finished, board, player, rounds_played, rounds_won, total_score in finished_games:
+        success_rate = rounds_won / rounds_played * 100 if rounds_played else 0
+        player_rows.append([board, player, rounds_played, rounds_won, total_score, success_rate,
+                            total_score])
+        day_rows.append([board, player, get_day(finished), rounds_played, rounds_won,
+                         total_score, total_score])
+
+    # Values on the right of SET are the totals before this game was added
+    connection.executemany(
+        "INSERT INTO leaderboard_players (board, player, games, rounds_played, rounds_won, "
+        "total_score, success_rate, best_game) VALUES (?, ?, 1, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (board, player) DO UPDATE SET games = games + 1, "
+        "rounds_played = rounds_played + excluded.rounds_played, "
+        "rounds_won = rounds_won + excluded.rounds_won, "
+        "total_score = total_score + excluded.total_score, "
+        "success_rate = (rounds_won + excluded.rounds_won) * 100.0 "
+        "/ MAX(1, rounds_played + excluded.rounds_played), "
+        "best_game = MAX(best_game, excluded.best_game)", player_rows)
+
+    connection.executemany(
+        "INSERT INTO leaderboard_days (board, player, day, games, rounds_played, rounds_won, "
+        "total_score, best_game) VALUES (?, ?, ?, 1, ?, ?, ?, ?) "
+        "ON CONFLICT (board, day, player) DO UPDATE SET games = games + 1, "
+        "rounds_played = rounds_played + excluded.rounds_played, "
+        "rounds_won = rounds_won + excluded.rounds_won, "
+        "total_score = total_score + excluded.total_score, "
+        "best_game = MAX(best_game, excluded.best_game)", day_rows)
+
+
+class Leaderboard:
+    """
+    Top players and player ranks, read from the history database
+    """
+
+    def __init__(self, db_file):
+        """
+        :param db_file: history database (see C_14_History_Store)
+        """
+        self.db_file = db_file
+
+    def query(self, sql, parameters):
+        connection = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def player_totals(self, days, board):
+        """
+        SQL for each player's totals on a leaderboard (all time, or over the last few days)
+        :return: SQL (a sub query) and its parameters
+        """
+        if days is None:
+            return ("SELECT player, games, rounds_played, rounds_won, total_score, "
+                    "success_rate, best_game FROM leaderboard_players WHERE board = ?", [board])
+
+        first_day = get_day(time.time()) - days + 1
+        return ("SELECT player, SUM(games) AS games, SUM(rounds_played) AS rounds_played, "
+                "SUM(rounds_won) AS rounds_won, SUM(total_score) AS total_score, "
+                "SUM(rounds_won) * 100.0 / MAX(1, SUM(rounds_played)) AS success_rate, "
+                "MAX(best_game) AS best_game FROM leaderboard_days WHERE board = ? AND day >= ? "
+                "GROUP BY player", [board, first_day])
+
+    def top(self, metric="total_score", k=10, days=None, board=DEFAULT_BOARD):
+        """
+        Finds the best players
+        :param metric: total_score, success_rate or best_game
+        :param k: number of players
+        :param days: only count the last few days (all time if not given)
+        :param board: kind of game (see get_board())
+        :return: list of [player, value, games, rounds played]
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown leaderboard {metric}")
+
+        totals, parameters = self.player_totals(days, board)
+        minimum = MIN_ROUNDS_FOR_SUCCESS if metric == "success_rate" else 0
+
+        rows = self.query(f"SELECT player, {metric}, games, rounds_played FROM ({totals}) "
+                          f"WHERE rounds_played >= ? ORDER BY {metric} DESC, player LIMIT ?",
+                          parameters + [minimum, k])
+        return [list(row) for row in rows]
+
+    def rank(self, player, metric="total_score", days=None, board=DEFAULT_BOARD):
+        """
+        Finds a player's place on a leaderboard (players with the same value share a place)
+        :return: rank, number of players on the leaderboard and the player's value
+        (None if the player isn't on the leaderboard)
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown leaderboard {metric}")
+
+        totals, parameters = self.player_totals(days, board)
+        minimum = MIN_ROUNDS_FOR_SUCCESS if metric == "success_rate" else 0
+
+        found = self.query(f"SELECT {metric}, rounds_played FROM ({totals}) WHERE player = ?",
+                           parameters + [player])
+        if not found or found[0][1] < minimum:
+            return None
+
+        # (all time totals have an index on each metric, so this only looks at better players)
+        value = found[0][0]
+        better = self.query(f"SELECT COUNT(*) FROM ({totals}) WHERE {metric} > ? "
+                            "AND rounds_played >= ?", parameters + [value, minimum])[0][0]
+        everyone = self.query(f"SELECT COUNT(*) FROM ({totals}) WHERE rounds_played >= ?",
+                              parameters + [minimum])[0][0]
+
+        return [better + 1, everyone, value]
+
+    def best_games(self, k=10, days=None, board=DEFAULT_BOARD):
+        """
+        Finds the highest scoring single games
+        :return: list of [player, total score, rounds played, finished time]
+        """
+        since = 0 if days is None else (get_day(time.time()) - days + 1) * SECONDS_PER_DAY
+        rows = self.query("SELECT player, total_score, rounds_played, finished FROM games "
+                          "WHERE board = ? AND finished IS NOT NULL AND finished >= ? "
+                          "ORDER BY total_score DESC LIMIT ?", [board, since, k])
+        return [list(row) for row in rows]
+
+
+def main(args=None):
+    from C_14_History_Store import HISTORY_FILE
+
+    parser = argparse.ArgumentParser(description="Show the Colour Quest leaderboards")
+    parser.add_argument("metric", nargs="?", default="total_score",
+                        choices=list(METRICS) + ["games"], help="leaderboard to show")
+    parser.add_argument("-k", "--top", type=int, default=10, help="number of places to show")
+    parser.add_argument("-d", "--days", type=int, help="only count the last few days")
+    parser.add_argument("--db", default=HISTORY_FILE, help="history database")
+    parser.add_argument("-p", "--player", help="show this player's rank")
+    parser.add_argument("--hard", action="store_true", help="hard mode leaderboard")
+    parser.add_argument("-c", "--colours", type=int, default=4,
+                        help="leaderboard for this many colours per round")
+    options = parser.parse_args(args)
+
+    leaderboard = Leaderboard(options.db)
+    board = get_board(options.hard, options.colours)
+
+    if options.metric == "games":
+        for place, (player, score, rounds, finished) in \
+                enumerate(leaderboard.best_games(options.top, options.days, board), start=1):
+            print(f"{place:>4}. {player:<20} {score:>8}  ({rounds} rounds)")
+        return
+
+    for place, (player, value, games, rounds) in \
+            enumerate(leaderboard.top(options.metric, options.top, options.days, board), start=1):
+        print(f"{place:>4}. {player:<20} {value:>10.0f}  ({games} games, {rounds} rounds)")
+
+    if options.player:
+        found = leaderboard.rank(options.player, options.metric, options.days, board)
+        if found is None:
+            print(f"{options.player} isn't on the leaderboard")
+        else:
+            print(f"{options.player} is {found[0]} of {found[1]}")
+
+
+# main routine
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import os
+import time
+
+GAME_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Replays of finished games are saved here
+REPLAY_FOLDER = os.path.join(GAME_FOLDER, "replays")
+
+# File layout: magic, version, then varints (7 bits per byte, high bit set if
+# more bytes follow)...
+#   seed | rounds wanted | colours in catalog | catalog fingerprint |
+#   colours per round | start time (ms since 1970) | rounds played
+#   then for each round: choice | ms since the previous choice (or the start)
+MAGIC = b"CQRP"
+VERSION = 1
+
+
+def add_varint(data, value):
+    """
+    Adds a whole number (0 or more) to the end of a bytearray
+    """
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def read_varint(data, position):
+    """
+    Reads a whole number written by add_varint()
+    :return: the number and the position after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        try:
+            byte = data[position]
+        except IndexError:
+            raise ValueError("Replay log is cut short")
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class ReplayLog:
+    """
+    Everything needed to play a game again - the seed (which decides the
+    colours) and the player's choices.  Times are only kept so a replay
+    shows when each choice was made.
+    """
+
+    def __init__(self, seed, rounds_wanted, colour_count, fingerprint, colours_per_round=4,
+                 started=None):
+        """
+        :param seed: seed of the game's random number generator
+        :param rounds_wanted: number of rounds chosen at the start
+        :param colour_count: colours in the catalog (replays need the same catalog)
+        :param fingerprint: catalog's get_fingerprint()
+        :param colours_per_round: colours offered each round
+        :param started: start time in seconds since 1970 (now if not given)
+        """
+        self.seed = seed
+        self.rounds_wanted = rounds_wanted
+        self.colour_count = colour_count
+        self.fingerprint = fingerprint
+        self.colours_per_round = colours_per_round
+        self.started = int((time.time() if started is None else started) * 1000)
+
+        # one byte per choice, ms gaps as varints (2 bytes for gaps under 16
+        # seconds, 3 under half an hour) - about 3 bytes a round in all
+        self.choices = bytearray()
+        self.times = bytearray()
+        self.last_time = self.started
+
+    def record(self, choice, when=None):
+        """
+        Adds a choice to the log
+        :param choice: position of the chosen colour
+        :param when: time of the choice (now if not given)
+        """
+        when = int((time.time() if when is None else when) * 1000)
+        self.choices.append(choice)
+        add_varint(self.times, max(0, when - self.last_time))
+        self.last_time = max(when, self.last_time)
+
+    def get_gaps(self):
+        """
+        :return: generator of the ms between each choice and the one before
+        (or the start)
+        """
+        position = 0
+        while position < len(self.times):
+            gap, position = read_varint(self.times, position)
+            yield gap
+
+    def to_bytes(self):
+        """
+        Packs the log into its file format
+        """
+        data = bytearray(MAGIC)
+        data.append(VERSION)
+        for value in [self.seed, self.rounds_wanted, self.colour_count, self.fingerprint,
+                      self.colours_per_round, self.started, len(self.choices)]:
+            add_varint(data, value)
+
+        for choice, gap in zip(self.choices, self.get_gaps()):
+            add_varint(data, choice)
+            add_varint(data, gap)
+
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Unpacks a log made by to_bytes()
+        :return: ReplayLog
+        """
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a Colour Quest replay log")
+        version = data[len(MAGIC):len(MAGIC) + 1]
+        if version != bytes([VERSION]):
+            raise ValueError(f"Unknown replay log version {version[0] if version else None}")
+
+        position = len(MAGIC) + 1
+        values = []
+        for item in range(7):
+            value, position = read_varint(data, position)
+            values.append(value)
+        seed, rounds_wanted, colour_count, fingerprint, colours_per_round, started, \
+            round_count = values
+
+        log = cls(seed, rounds_wanted, colour_count, fingerprint, colours_per_round,
+                  started / 1000)
+        total_gap = 0
+        for item in range(round_count):
+            choice, position = read_varint(data, position)
+            gap_start = position
+            gap, position = read_varint(data, position)
+            log.choices.append(choice)
+            log.times += data[gap_start:position]
+            total_gap += gap
+        log.last_time = log.started + total_gap
+
+        return log
+
+    def save(self, file_name=None):
+        """
+        Writes the log to a file
+        :param file_name: file to write (in the replay folder if not given)
+        :return: file name
+        """
+        if file_name is None:
+            os.makedirs(REPLAY_FOLDER, exist_ok=True)
+            file_name = os.path.join(REPLAY_FOLDER, f"{self.started}_{self.seed:016x}.cqreplay")
+
+        with open(file_name, "wb") as file:
+            file.write(self.to_bytes())
+        return file_name
+
+    @classmethod
+    def load(cls, file_name):
+        with open(file_name, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+def replay(log, catalog=None, keep_all_scores=False):
+    """
+    Plays a logged game again without any interface
+    :param log: ReplayLog
+    :param catalog: colour catalog the game was played with (shared catalog, or
+    the RGB catalog for hard mode games, if not given)
+    :param keep_all_scores: True to keep every round's scores (normally only
+    the latest rounds are kept, like a game)
+    :return: GameSession in the same state as the original game (ie: same
+    rounds and stats)
+
+    Only the scores of each round are worked out (see GameSession.play_choices()),
+    so 10,000 rounds take about 30 - 40 ms.  Games with too many colours per
+    round for a table choose every colour, which is about 6 times slower.
+    """
+    from C_06_Colour_Catalog import get_catalog
+    from C_07_Game_Engine import SCORE_LIMIT, GameSession
+    from C_19_RGB_Catalog import RGB_COLOURS, get_rgb_catalog
+
+    if catalog is None:
+        catalog = get_rgb_catalog() if log.colour_count == RGB_COLOURS else get_catalog()
+
+    if len(catalog.get_colours()) != log.colour_count:
+        raise ValueError(f"Game was played with {log.colour_count} colours but the "
+                         f"catalog has {len(catalog.get_colours())}")
+
+    if catalog.get_fingerprint() != log.fingerprint:
+        raise ValueError("Game was played with a different colour catalog (the colour "
+                         "file has changed since)")
+
+    # Don't log the replay itself (the original log is already there)
+    game = GameSession(log.rounds_wanted, catalog=catalog, seed=log.seed, keep_log=False,
+                       colours_per_round=log.colours_per_round,
+                       hard_mode=log.colour_count == RGB_COLOURS,
+                       score_limit=None if keep_all_scores else SCORE_LIMIT)
+    game.play_choices(log.choices)
+
+    return game
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Replay a saved Colour Quest game")
+    parser.add_argument("replay_file", help="replay log (.cqreplay)")
+    parser.add_argument("-r", "--rounds", action="store_true", help="show every round")
+    options = parser.parse_args(args)
+
+    log = ReplayLog.load(options.replay_file)
+
+    start = time.perf_counter()
+    game = replay(log, keep_all_scores=options.rounds)
+    taken = time.perf_counter() - start
+
+    print(f"Seed {log.seed:016x}, {len(log.choices)} of {log.rounds_wanted} rounds "
+          f"({log.colours_per_round} colours each), "
+          f"started {time.ctime(log.started / 1000)}")
+
+    if options.rounds:
+        played = log.started
+        for count, gap in enumerate(log.get_gaps()):
+            played += gap
+            print(f"Round {count + 1}: chose {log.choices[count] + 1}, score "
+                  f"{game.all_scores_list[count]} / {game.all_high_score_list[count]} "
+                  f"at {time.strftime('%H:%M:%S', time.localtime(played / 1000))}")
+
+    if game.rounds_played:
+        rounds_won, rounds_played, success_rate, total_score, max_possible, best_score, \
+            average_score = game.stats()
+        print(f"Success Rate: {rounds_won} / {rounds_played} ({success_rate:.0f}%)")
+        print(f"Total Score: {total_score} (maximum possible {max_possible})")
+        print(f"Best Score: {best_score}, Average Score: {average_score:.0f}")
+
+    print(f"Replayed in {taken * 1000:.1f} ms")
+
+
+# main routine
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+GAME_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Set COLOUR_QUEST_METRICS=1 to time the game (or set it to a file name to choose
+# where the results are saved).  When it isn't set timers / counters do nothing.
+METRICS_SETTING = os.environ.get("COLOUR_QUEST_METRICS", "")
+ENABLED = METRICS_SETTING not in ["", "0"]
+METRICS_FILE = (METRICS_SETTING if METRICS_SETTING not in ["", "0", "1"]
+                else os.path.join(GAME_FOLDER, "colour_quest_metrics.json"))
+
+# Shared 'do nothing' timer handed out while metrics are off
+NO_TIMER = nullcontext()
+
+
+class Histogram:
+    """
+    Counts times (in nanoseconds) in buckets - four for each doubling
+    of time (so about 20% wide) - so adding a time is cheap and memory
+    use doesn't grow
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.lowest = None
+        self.highest = 0
+
+        # shortest time in the bucket -> count
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.lowest is None or value < self.lowest:
+            self.lowest = value
+        if value > self.highest:
+            self.highest = value
+
+        # keep the top three bits of the time
+        shift = max(0, value.bit_length() - 3)
+        bucket = value >> shift << shift
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):
+        """
+        Estimates a percentile (the top of the bucket it falls in)
+        :param percent: 0 - 100
+        :return: time in nanoseconds
+        """
+        wanted = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(bucket + (1 << max(0, bucket.bit_length() - 3)) - 1, self.highest)
+        return self.highest
+
+    def summary(self):
+        """
+        :return: dictionary ready to be turned into JSON
+        """
+        return {"count": self.count, "total_ns": self.total,
+                "mean_ns": self.total / self.count if self.count else 0,
+                "min_ns": self.lowest or 0, "p50_ns": self.percentile(50),
+                "p99_ns": self.percentile(99), "max_ns": self.highest,
+                "buckets": {str(bucket): count
+                            for bucket, count in sorted(self.buckets.items())}}
+
+
+class Timer:
+    """
+    Times a block of code and adds the time to a histogram
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.add(time.perf_counter_ns() - self.start)
+        return False
+
+
+class Metrics:
+    """
+    Named counters and timing histograms
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def get_histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def timer(self, name):
+        return Timer(self.get_histogram(name))
+
+    def add_count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        return {"counters": dict(sorted(self.counters.items())),
+                "timers": {name: histogram.summary()
+                           for name, histogram in sorted(self.histograms.items())}}
+
+    def summary(self):
+        """
+        Describes the timers and counters in a few lines of text
+        :return: list of lines
+        """
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            details = histogram.summary()
+            lines.append(f"{name}: {details['count']} x, mean {details['mean_ns'] / 1000:.1f} us, "
+                         f"p99 {details['p99_ns'] / 1000:.1f} us, "
+                         f"max {details['max_ns'] / 1000:.1f} us")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+        return lines
+
+    def dump(self, file_name=METRICS_FILE):
+        """
+        Saves everything to a JSON file
+        """
+        try:
+            with open(file_name, "w") as file:
+                json.dump(self.to_dict(), file, indent=2)
+        except OSError as error:
+            print(f"Metrics couldn't be saved: {error}", file=sys.stderr)
+
+
+# One set of metrics shared by the whole program
+metrics = Metrics()
+
+
+def timer(name):
+    """
+    Times a block of code, eg: with timer("play.new_round"): ...
+    :param name: timer name (dotted, eg: area.what)
+    """
+    if not ENABLED:
+        return NO_TIMER
+    return metrics.timer(name)
+
+
+def timed(name):
+    """
+    Decorator which times every call of a function (the function is left
+    untouched if metrics are off, so there is no cost at all)
+    """
+
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        histogram = metrics.get_histogram(name)
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.add(time.perf_counter_ns() - start)
+
+        return timed_function
+
+    return decorate
+
+
+def add_count(name, amount=1):
+    """
+    Adds to a counter (does nothing if metrics are off)
+    """
+    if ENABLED:
+        metrics.add_count(name, amount)
+
+
+def summary():
+    """
+    Lines describing everything measured so far (empty if metrics are off)
+    """
+    return metrics.summary()
+
+
+if ENABLED:
+    atexit.register(metrics.dump)
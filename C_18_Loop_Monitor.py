@@ -0,0 +1,146 @@
+import atexit
+import os
+import sys
+import time
+from functools import wraps
+
+from C_17_Instrumentation import metrics
+
+# Set COLOUR_QUEST_LOOP_MONITOR=1 to watch how long the Tk event loop is kept
+# busy (or set it to the heartbeat interval in ms).  When it isn't set nothing
+# is scheduled and callbacks are left untouched.
+MONITOR_SETTING = os.environ.get("COLOUR_QUEST_LOOP_MONITOR", "")
+ENABLED = MONITOR_SETTING not in ["", "0"]
+
+# Heartbeat interval and the lag which counts as a stall (ms)
+INTERVAL = int(MONITOR_SETTING) if MONITOR_SETTING.isdigit() and MONITOR_SETTING != "1" else 50
+STALL = 100
+
+
+class LoopMonitor:
+    """
+    Schedules a heartbeat with after() and measures how late each beat
+    fires.  A late beat means a callback kept the event loop busy, so the
+    slowest callback since the last beat gets the blame.
+    """
+
+    def __init__(self, root, interval=INTERVAL, stall=STALL):
+        """
+        :param root: Tk window whose event loop is watched
+        :param interval: ms between heartbeats
+        :param stall: lag (ms) that counts as a stall
+        """
+        self.root = root
+        self.interval = interval
+        self.stall_ns = stall * 1000000
+
+        # Lag of every beat (in the shared metrics so it shows up with the other timings)
+        self.lag = metrics.get_histogram("loop.lag")
+
+        # Slowest callback since the last beat (name | ns)
+        self.slowest = [None, 0]
+
+        # callback name -> [stalls, worst lag in ns]
+        self.stalls = {}
+
+        self.expected = 0
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.schedule()
+
+    def stop(self):
+        self.running = False
+
+    def schedule(self):
+        self.expected = time.perf_counter_ns() + self.interval * 1000000
+        self.root.after(self.interval, self.beat)
+
+    def beat(self):
+        """
+        Heartbeat - works out how late it is and who caused it
+        """
+        if not self.running:
+            return
+
+        lag = max(0, time.perf_counter_ns() - self.expected)
+        self.lag.add(lag)
+
+        if lag >= self.stall_ns:
+            name = self.slowest[0] or "(unknown - not a monitored callback)"
+            found = self.stalls.setdefault(name, [0, 0])
+            found[0] += 1
+            found[1] = max(found[1], lag)
+
+        self.slowest = [None, 0]
+        self.schedule()
+
+    def callback_finished(self, name, taken):
+        """
+        Notes how long a callback took (called by monitored())
+        """
+        if taken > self.slowest[1]:
+            self.slowest = [name, taken]
+
+    def report(self):
+        """
+        Describes the lag and stalls
+        :return: list of lines
+        """
+        if not self.lag.count:
+            return ["Event loop: no heartbeats"]
+
+        lines = [f"Event loop lag over {self.lag.count} beats: "
+                 f"p50 {self.lag.percentile(50) / 1000000:.1f} ms, "
+                 f"p90 {self.lag.percentile(90) / 1000000:.1f} ms, "
+                 f"p99 {self.lag.percentile(99) / 1000000:.1f} ms, "
+                 f"max {self.lag.highest / 1000000:.1f} ms"]
+
+        for name, [stalls, worst] in sorted(self.stalls.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {name}: {stalls} stalls, worst {worst / 1000000:.1f} ms")
+
+        return lines
+
+
+# The monitor for the game (set by start_monitor())
+monitor = None
+
+
+def monitored(function):
+    """
+    Decorator for Tk callbacks so stalls can be blamed on them (the
+    function is left untouched if the monitor is off)
+    """
+    if not ENABLED:
+        return function
+
+    name = function.__qualname__
+
+    @wraps(function)
+    def monitored_function(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if monitor is not None:
+                monitor.callback_finished(name, time.perf_counter_ns() - start)
+
+    return monitored_function
+
+
+def start_monitor(root):
+    """
+    Starts watching the event loop if COLOUR_QUEST_LOOP_MONITOR is set.  The
+    report is printed when the program ends.
+    :return: LoopMonitor (or None if the monitor is off)
+    """
+    global monitor
+
+    if not ENABLED:
+        return None
+
+    monitor = LoopMonitor(root)
+    monitor.start()
+    atexit.register(lambda: print("\n".join(monitor.report()), file=sys.stderr))
+    return monitor
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from collections.abc import Sequence
+
+from C_06_Colour_Catalog import Colour, ColourCatalog
+
+# Every 24 bit colour (#000000 - #FFFFFF)
+RGB_COLOURS = 0x1000000
+WHITE_HEX = 0xFFFFFF
+HIGHEST_SCORE = 20
+
+# Same rules as C_12_Colour_Scores (repeated here so hard mode doesn't need numpy):
+# text is black when the colour's luminance is above this
+BLACK_TEXT_LUMINANCE = 0.0525 ** 0.5 - 0.05
+
+# Linear (light) value of each 0 - 255 channel value
+LINEAR_CHANNEL = [value / 255 / 12.92 if value / 255 <= 0.04045
+                  else ((value / 255 + 0.055) / 1.055) ** 2.4
+                  for value in range(256)]
+
+
+def score_hex(hex_value):
+    """
+    Score of a colour - its hex code as a fraction of white out of 20,
+    rounded like round_ans() (whole numbers only)
+    """
+    return (hex_value * HIGHEST_SCORE * 2 + WHITE_HEX) // (WHITE_HEX * 2)
+
+
+def first_hex_for_score(score):
+    """
+    Lowest hex code with a score of at least 'score' (opposite of score_hex())
+    """
+    if score <= 0:
+        return 0
+    return -(-(score * 2 - 1) * WHITE_HEX // (HIGHEST_SCORE * 2))
+
+
+def make_rgb_colour(hex_value):
+    """
+    Works out the name, score and text colour of a hex code
+    :return: Colour (the name is the hex code, which Tk understands)
+    """
+    red, green, blue = hex_value >> 16, hex_value >> 8 & 0xFF, hex_value & 0xFF
+    luminance = (0.2126 * LINEAR_CHANNEL[red] + 0.7152 * LINEAR_CHANNEL[green]
+                 + 0.0722 * LINEAR_CHANNEL[blue])
+    fg = "black" if luminance >= BLACK_TEXT_LUMINANCE else "white"
+
+    return Colour(f"#{hex_value:06x}", score_hex(hex_value), fg)
+
+
+class RGBColours(Sequence):
+    """
+    List-like run of hex codes - each colour is made when it is asked for
+    """
+
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[count] for count in range(*item.indices(len(self)))]
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("colour index out of range")
+
+        return make_rgb_colour(self.start + item)
+
+
+class RGBCatalog(ColourCatalog):
+    """
+    'Hard mode' catalog of all 16.7 million RGB colours.  Nothing is stored
+    per colour: each score is one run of hex codes, so the score buckets are
+    just start / stop numbers and the usual choose_round_colours() picks
+    distinct scores straight from them.
+    """
+
+    def __init__(self):
+        super().__init__(file_name=None)
+
+    def load(self):
+        starts = [first_hex_for_score(score) for score in range(HIGHEST_SCORE + 2)]
+        starts[-1] = RGB_COLOURS
+
+        self.score_buckets = {score: RGBColours(starts[score], starts[score + 1])
+                              for score in range(HIGHEST_SCORE + 1)}
+        self.colours = RGBColours(0, RGB_COLOURS)
+        self.loaded = True
+        return self.colours
+
+    def get_fingerprint(self):
+        """
+        Hash of the score runs (there are too many colours to go through each one)
+        """
+        if self.fingerprint is None:
+            runs = ",".join(f"{score}:{bucket.start}-{bucket.stop}"
+                            for score, bucket in self.get_score_buckets().items())
+            self.fingerprint = int.from_bytes(hashlib.sha256(runs.encode()).digest()[:8], "little")
+
+        return self.fingerprint
+
+
+# One RGB catalog shared by the whole program
+shared_rgb_catalog = None
+shared_rgb_catalog_lock = threading.Lock()
+
+
+def get_rgb_catalog():
+    """
+    Gets the shared RGB catalog (creating it on first use)
+    """
+    global shared_rgb_catalog
+
+    if shared_rgb_catalog is None:
+        with shared_rgb_catalog_lock:
+            if shared_rgb_catalog is None:
+                shared_rgb_catalog = RGBCatalog()
+
+    return shared_rgb_catalog
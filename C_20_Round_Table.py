@@ -0,0 +1,362 @@
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import threading
+import weakref
+from array import array
+from math import comb
+
+from C_06_Colour_Catalog import get_catalog
+from C_07_Game_Engine import MAX_COLOURS, MIN_COLOURS, median_score
+
+GAME_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Tables are kept here, one file per set of score buckets / colours per round
+CACHE_FOLDER = os.path.join(GAME_FOLDER, "round_table_cache")
+
+# Change this if the table (or the way rounds are picked) changes
+TABLE_VERSION = b"round-table-v1"
+
+# File layout: header, then row scores (uint16 x rows x colours per round),
+# probabilities (float64 x rows), targets (uint16 x rows), highest scores (uint16 x rows)
+MAGIC = b"CQRTAB01"
+BYTE_ORDER = sys.byteorder.encode()[:1]
+
+# magic | byte order | colours per round | rows
+HEADER = struct.Struct("<8sc3xII")
+
+# Most partial rounds worked through while building a table (keeps big k from
+# taking forever - 21 scores and 4 colours is under 8,000, 8 colours about 400,000)
+MAX_STATES = 500000
+
+# Catalog -> [score buckets the tables were made from, {colours per round: table}]
+round_table_cache = weakref.WeakKeyDictionary()
+
+# Tables are loaded on worker threads too, so only let one thread make them at a time
+round_table_lock = threading.Lock()
+
+
+def get_round_odds(weights, how_many):
+    """
+    Works out the exact chance of every set of buckets a round can have, using
+    the same rule as choose_round_colours() (each pick is weighted by bucket
+    size, and picked buckets can't be picked again).  Each order a set can be
+    picked in is added up.
+    :param weights: bucket sizes
+    :param how_many: colours per round
+    :return: dictionary of bucket set (bit mask) -> chance
+    """
+    states = sum(comb(len(weights), count) for count in range(how_many + 1))
+    if how_many > len(weights) or states > MAX_STATES:
+        raise ValueError(f"Can't make a table for {how_many} colours from {len(weights)} scores")
+
+    total = sum(weights)
+
+    # bucket set -> [chance, size of the buckets in it]
+    layer = {0: [1.0, 0]}
+    for pick in range(how_many):
+        next_layer = {}
+        for mask, [chance, used] in layer.items():
+            weight_left = total - used
+            for position, weight in enumerate(weights):
+                bit = 1 << position
+                if mask & bit:
+                    continue
+
+                next_chance = chance * weight / weight_left
+                found = next_layer.get(mask | bit)
+                if found is None:
+                    next_layer[mask | bit] = [next_chance, used + weight]
+                else:
+                    found[0] += next_chance
+        layer = next_layer
+
+    return {mask: chance for mask, [chance, used] in layer.items()}
+
+
+class RoundTable:
+    """
+    Every set of scores a round can have, with its exact chance, target and
+    highest score.  Rounds can be drawn from it with one random number (alias
+    method) and questions about rounds answered without playing any.
+    """
+
+    def __init__(self, colours_per_round, row_scores, probabilities, targets, highest):
+        """
+        :param colours_per_round: colours in each round
+        :param row_scores: scores of every row one after the other (array of uint16)
+        :param probabilities: chance of each row (array of float64)
+        :param targets: target (median) of each row
+        :param highest: highest score of each row
+        """
+        self.colours_per_round = colours_per_round
+        self.row_scores = row_scores
+        self.probabilities = probabilities
+        self.targets = targets
+        self.highest = highest
+        self.make_alias_table()
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    def get_scores(self, row):
+        """
+        Scores in a row (lowest first)
+        """
+        start = row * self.colours_per_round
+        return list(self.row_scores[start:start + self.colours_per_round])
+
+    def make_alias_table(self):
+        """
+        Sets up the alias method (Vose) - every row gets an equal slice, and
+        each slice is shared between its own row and one other row
+        """
+        rows = len(self.probabilities)
+        scaled = [chance * rows for chance in self.probabilities]
+        self.keep = array("d", [1.0] * rows)
+        self.alias = array("I", range(rows))
+
+        small = [row for row in range(rows) if scaled[row] < 1]
+        large = [row for row in range(rows) if scaled[row] >= 1]
+        while small and large:
+            row = small.pop()
+            other = large[-1]
+            self.keep[row] = scaled[row]
+            self.alias[row] = other
+
+            scaled[other] -= 1 - scaled[row]
+            if scaled[other] < 1:
+                small.append(large.pop())
+
+        # anything left is 1 (give or take rounding)
+        for row in small + large:
+            self.keep[row] = 1.0
+
+    def draw(self, rng):
+        """
+        Picks a row with its chance
+        :param rng: random number generator (anything with random)
+        :return: row number
+        """
+        position = rng.random() * len(self.keep)
+        row = int(position)
+        if position - row < self.keep[row]:
+            return row
+        return self.alias[row]
+
+    def draw_round(self, catalog, rng):
+        """
+        Draws a round (same odds as get_round_colours(), but only one lookup to
+        choose the scores)
+        :param catalog: colour catalog the table was made for
+        :return: list of colours (in a random order), target and highest score
+        """
+        row = self.draw(rng)
+        score_buckets = catalog.get_score_buckets()
+
+        round_colours = []
+        for score in self.get_scores(row):
+            bucket = score_buckets[score]
+            round_colours.append(bucket[min(int(rng.random() * len(bucket)), len(bucket) - 1)])
+        rng.shuffle(round_colours)
+
+        return round_colours, self.targets[row], self.highest[row]
+
+    def draw_scores(self, rng):
+        """
+        Draws a round's scores without looking its colours up.  The random
+        numbers are used in the same way as draw_round(), so a seeded game can
+        be followed quickly (eg: replays) and still come out the same.
+        :return: list of scores (in the round's order), target and highest score
+        """
+        row = self.draw(rng)
+        scores = self.get_scores(row)
+        for score in scores:
+            rng.random()
+        rng.shuffle(scores)
+
+        return scores, self.targets[row], self.highest[row]
+
+    def distribution(self, values):
+        """
+        Chance of each value of a column (eg: targets)
+        :return: dictionary of value -> chance
+        """
+        chances = {}
+        for value, chance in zip(values, self.probabilities):
+            chances[value] = chances.get(value, 0) + chance
+        return dict(sorted(chances.items()))
+
+    def target_distribution(self):
+        return self.distribution(self.targets)
+
+    def highest_distribution(self):
+        return self.distribution(self.highest)
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, BYTE_ORDER, self.colours_per_round, len(self))
+        return b"".join([header, self.row_scores.tobytes(), self.probabilities.tobytes(),
+                         self.targets.tobytes(), self.highest.tobytes()])
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, byte_order, colours_per_round, rows = HEADER.unpack_from(data)
+        if magic != MAGIC or byte_order != BYTE_ORDER:
+            raise ValueError("Not a round table for this machine")
+
+        position = HEADER.size
+        sections = []
+        for type_code, count in [["H", rows * colours_per_round], ["d", rows], ["H", rows],
+                                 ["H", rows]]:
+            section = array(type_code)
+            end = position + count * section.itemsize
+            if end > len(data):
+                raise ValueError("Round table is cut short")
+            section.frombytes(data[position:end])
+            sections.append(section)
+            position = end
+
+        return cls(colours_per_round, *sections)
+
+
+def build_round_table(score_buckets, colours_per_round=4):
+    """
+    Makes the table for a set of score buckets
+    :param score_buckets: dictionary of score -> colours with that score
+    :param colours_per_round: colours in each round
+    :return: RoundTable
+    """
+    scores = sorted(score_buckets)
+    odds = get_round_odds([len(score_buckets[score]) for score in scores], colours_per_round)
+
+    row_scores = array("H")
+    probabilities = array("d")
+    targets = array("H")
+    highest = array("H")
+    for mask in sorted(odds):
+        row = [score for position, score in enumerate(scores) if mask >> position & 1]
+        row_scores.extend(row)
+        probabilities.append(odds[mask])
+        highest.append(row[-1])
+        targets.append(median_score(row))
+
+    return RoundTable(colours_per_round, row_scores, probabilities, targets, highest)
+
+
+def get_cache_key(score_buckets, colours_per_round):
+    """
+    Makes a key from the bucket sizes (all the table depends on)
+    :return: hex digest
+    """
+    digest = hashlib.sha256(TABLE_VERSION)
+    digest.update(str(colours_per_round).encode())
+    for score in sorted(score_buckets):
+        digest.update(f",{score}:{len(score_buckets[score])}".encode())
+    return digest.hexdigest()
+
+
+def load_round_table(score_buckets, colours_per_round=4, use_cache=True):
+    """
+    Reads a table from the disk cache, or builds (and caches) it if it isn't there
+    :return: RoundTable
+    """
+    cache_file = os.path.join(CACHE_FOLDER,
+                              get_cache_key(score_buckets, colours_per_round) + ".cqtable")
+
+    if use_cache:
+        try:
+            with open(cache_file, "rb") as file:
+                return RoundTable.from_bytes(file.read())
+        except (OSError, ValueError, struct.error):
+            pass
+
+    table = build_round_table(score_buckets, colours_per_round)
+
+    if use_cache:
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(CACHE_FOLDER, exist_ok=True)
+            with open(temp_file, "wb") as file:
+                file.write(table.to_bytes())
+            os.replace(temp_file, cache_file)
+        except OSError:
+            # caching is only to save time, so carry on without it
+            pass
+
+    return table
+
+
+def get_round_table(catalog=None, colours_per_round=4):
+    """
+    Gets the round table for a catalog (kept until the catalog's colours change)
+    :param catalog: colour catalog (shared catalog if not given)
+    :param colours_per_round: colours in each round
+    :return: RoundTable
+    """
+    if catalog is None:
+        catalog = get_catalog()
+
+    score_buckets = catalog.get_score_buckets()
+
+    cached = round_table_cache.get(catalog)
+    if cached is not None and cached[0] is score_buckets and colours_per_round in cached[1]:
+        return cached[1][colours_per_round]
+
+    with round_table_lock:
+        cached = round_table_cache.get(catalog)
+        if cached is None or cached[0] is not score_buckets:
+            cached = [score_buckets, {}]
+            round_table_cache[catalog] = cached
+
+        # (another thread may have made it while we waited)
+        table = cached[1].get(colours_per_round)
+        if table is None:
+            table = cached[1][colours_per_round] = load_round_table(score_buckets,
+                                                                    colours_per_round)
+
+    return table
+
+
+def preload_round_tables(catalog=None):
+    """
+    Loads (or makes) the table for every number of colours per round that a
+    table can be made for, so games never have to wait for one
+    :return: list of the colours per round with a table
+    """
+    if catalog is None:
+        catalog = get_catalog()
+
+    loaded = []
+    for colours_per_round in range(MIN_COLOURS, MAX_COLOURS + 1):
+        try:
+            get_round_table(catalog, colours_per_round)
+        except ValueError:
+            break
+        loaded.append(colours_per_round)
+
+    return loaded
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Show the odds of each round target")
+    parser.add_argument("-k", "--colours", type=int, default=4, help="colours per round")
+    parser.add_argument("--hard", action="store_true", help="use every RGB colour")
+    options = parser.parse_args(args)
+
+    catalog = None
+    if options.hard:
+        from C_19_RGB_Catalog import get_rgb_catalog
+        catalog = get_rgb_catalog()
+
+    table = get_round_table(catalog, options.colours)
+    print(f"{len(table)} possible sets of scores")
+    print("Target  Chance")
+    for target, chance in table.target_distribution().items():
+        print(f"{target:>6}  {chance * 100:6.2f}%")
+
+
+# main routine
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import random
+import threading
+import weakref
+
+from C_06_Colour_Catalog import get_catalog
+from C_07_Game_Engine import median_score
+from C_20_Round_Table import get_round_table
+
+# Ways of playing the baselines are worked out for (name | description)
+STRATEGIES = {
+    "random": "Random play",
+    "greedy": "Greedy play",
+    "oracle": "Best play",
+}
+
+# Rounds played to estimate the baselines when there are too many colours per
+# round for a round table (close to 1% of the exact answer)
+SAMPLE_ROUNDS = 20000
+
+# Catalog -> [score buckets the baselines were made from, {colours per round: baselines}]
+baseline_cache = weakref.WeakKeyDictionary()
+
+# Baselines are worked out on worker threads, so only let one thread work them out at a time
+baseline_lock = threading.Lock()
+
+
+def get_round_results(scores, target):
+    """
+    Exact result of one round for each strategy.
+    random - any colour (all equally likely)
+    greedy - sees the scores and takes the first colour that beats the target
+    (colours are in a random order, so any of the winning colours)
+    oracle - sees the scores and takes the highest
+    :param scores: scores in the round
+    :param target: score to beat
+    :return: dictionary of strategy -> [expected score, expected score squared, chance of winning]
+    """
+    winning = [score for score in scores if score >= target]
+
+    return {
+        "random": [sum(winning) / len(scores), sum(score * score for score in winning) / len(scores),
+                   len(winning) / len(scores)],
+        "greedy": [sum(winning) / len(winning), sum(score * score for score in winning) / len(winning),
+                   1.0],
+        "oracle": [max(scores), max(scores) ** 2, 1.0],
+    }
+
+
+def get_round_totals(catalog, colours_per_round):
+    """
+    Adds up each strategy's results over every round in the round table
+    (weighted by the chance of the round)
+    :return: dictionary of strategy -> [expected score, expected score squared,
+    chance of winning]
+    """
+    table = get_round_table(catalog, colours_per_round)
+
+    totals = {strategy: [0.0, 0.0, 0.0] for strategy in STRATEGIES}
+    for row, chance in enumerate(table.probabilities):
+        results = get_round_results(table.get_scores(row), table.targets[row])
+        for strategy, values in results.items():
+            for count, value in enumerate(values):
+                totals[strategy][count] += chance * value
+
+    return totals
+
+
+def estimate_round_totals(catalog, colours_per_round, rounds=SAMPLE_ROUNDS):
+    """
+    Same as get_round_totals() but from rounds chosen at random (for when there
+    are too many colours per round for a round table).  The generator has a
+    fixed seed so the estimate is always the same.
+    """
+    rng = random.Random(0)
+
+    totals = {strategy: [0.0, 0.0, 0.0] for strategy in STRATEGIES}
+    for item in range(rounds):
+        scores = [int(colour[1]) for colour in catalog.choose_round_colours(colours_per_round, rng)]
+        results = get_round_results(scores, median_score(scores))
+        for strategy, values in results.items():
+            for count, value in enumerate(values):
+                totals[strategy][count] += value / rounds
+
+    return totals
+
+
+def get_round_baselines(catalog=None, colours_per_round=4):
+    """
+    Expected result of a single round for each strategy, worked out exactly
+    from the round table (ie: the catalog's score histogram), or estimated
+    if there are too many colours per round for a table.  Kept until the
+    catalog's colours change.  This can take a few seconds the first time,
+    so the game works it out on a worker thread.
+    :return: dictionary of strategy -> [expected score, variance of the score,
+    chance of winning] | True if the numbers are estimated (not exact)
+    """
+    if catalog is None:
+        catalog = get_catalog()
+
+    score_buckets = catalog.get_score_buckets()
+
+    cached = baseline_cache.get(catalog)
+    if cached is not None and cached[0] is score_buckets and colours_per_round in cached[1]:
+        return cached[1][colours_per_round]
+
+    with baseline_lock:
+        cached = baseline_cache.get(catalog)
+        if cached is None or cached[0] is not score_buckets:
+            cached = [score_buckets, {}]
+            baseline_cache[catalog] = cached
+
+        # (another thread may have worked it out while we waited)
+        if colours_per_round not in cached[1]:
+            try:
+                totals = get_round_totals(catalog, colours_per_round)
+                estimated = False
+            except ValueError:
+                totals = estimate_round_totals(catalog, colours_per_round)
+                estimated = True
+
+            cached[1][colours_per_round] = [{
+                strategy: [mean, max(0.0, mean_square - mean * mean), win_chance]
+                for strategy, [mean, mean_square, win_chance] in totals.items()
+            }, estimated]
+
+    return cached[1][colours_per_round]
+
+
+def get_game_baselines(rounds, catalog=None, colours_per_round=4):
+    """
+    Expected results of a whole game for each strategy (rounds are independent,
+    so this takes the same time for any number of rounds)
+    :param rounds: rounds played
+    :return: dictionary of strategy -> [expected total score, standard deviation
+    of the total, expected rounds won, chance of winning a round] | True if the
+    numbers are estimated (see get_round_baselines())
+    """
+    per_round, estimated = get_round_baselines(catalog, colours_per_round)
+
+    return [{strategy: [mean * rounds, (variance * rounds) ** 0.5, win_chance * rounds, win_chance]
+             for strategy, [mean, variance, win_chance] in per_round.items()}, estimated]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Show the expected scores of each way of playing")
+    parser.add_argument("-r", "--rounds", type=int, default=10, help="rounds per game")
+    parser.add_argument("-k", "--colours", type=int, default=4, help="colours per round")
+    parser.add_argument("--hard", action="store_true", help="use every RGB colour")
+    options = parser.parse_args(args)
+
+    catalog = None
+    if options.hard:
+        from C_19_RGB_Catalog import get_rgb_catalog
+        catalog = get_rgb_catalog()
+
+    try:
+        baselines, estimated = get_game_baselines(options.rounds, catalog, options.colours)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if estimated:
+        print(f"Too many colours per round to work these out exactly - estimated from "
+              f"{SAMPLE_ROUNDS} random rounds (about 1% out)")
+
+    approx = "≈" if estimated else ""
+    for strategy, [total, deviation, rounds_won, win_chance] in baselines.items():
+        print(f"{STRATEGIES[strategy]:<12} score {approx + f'{total:.2f}':>8} (+/- {deviation:.2f})  "
+              f"rounds won {approx}{rounds_won:.2f} ({win_chance * 100:.1f}%)")
+
+
+# main routine
+if __name__ == "__main__":
+    main()
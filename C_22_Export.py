@@ -0,0 +1,338 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+
+from C_14_History_Store import GAME_COLUMNS, HISTORY_FILE, ROUND_COLUMNS
+
+# Columns of each table (name | type - q is a whole number, d a decimal, s text)
+TABLE_COLUMNS = {
+    "rounds": [[name, "s" if name in ["game_id", "player", "colours", "scores"]
+                else "d" if name == "played" else "q"] for name in ROUND_COLUMNS],
+    "games": [[name, "s" if name in ["game_id", "player", "board"]
+               else "d" if name in ["started", "finished"] else "q"] for name in GAME_COLUMNS],
+}
+
+# Column the date filters / order use for each table
+TIME_COLUMN = {"rounds": "played", "games": "started"}
+ORDER_COLUMN = {"rounds": "round_id", "games": "started"}
+
+# Rows fetched from the database at a time (so memory use doesn't grow)
+BATCH_SIZE = 10000
+
+# Columnar file layout (numbers in the machine's byte order, sections padded to 8 bytes)
+#   header
+#   column list     type (1 byte) | name size (1 byte) | name (utf-8), padded
+#   chunks          rows (uint32, 4 bytes padding), then each column in turn:
+#                     q / d - int64 / float64 x rows  (missing decimals are NaN)
+#                     s     - offsets uint32 x rows + 1, then the text (utf-8)
+#   end             a chunk with 0 rows
+MAGIC = b"CQCOLS01"
+BYTE_ORDER = sys.byteorder.encode()[:1]
+
+# magic | byte order | columns
+HEADER = struct.Struct("<8sc3xI")
+CHUNK = struct.Struct("<I4x")
+
+# Rows in each chunk of a columnar file
+CHUNK_ROWS = 65536
+
+
+def padded(data):
+    """
+    Pads bytes with zeros so the next section starts on an 8 byte boundary
+    """
+    return data + bytes(-len(data) % 8)
+
+
+def read_rows(table, db_file=HISTORY_FILE, player=None, since=None, until=None,
+              batch_size=BATCH_SIZE):
+    """
+    Reads a table from the history store a batch at a time (oldest first)
+    :param table: rounds / games
+    :param player: only this player's rows (everyone if not given)
+    :param since: / until: times (seconds since 1970) to look between
+    :return: generator of rows (tuples in TABLE_COLUMNS order)
+    """
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+
+    conditions = []
+    parameters = []
+    if player is not None:
+        conditions.append("player = ?")
+        parameters.append(player)
+    if since is not None:
+        conditions.append(f"{TIME_COLUMN[table]} >= ?")
+        parameters.append(since)
+    if until is not None:
+        conditions.append(f"{TIME_COLUMN[table]} < ?")
+        parameters.append(until)
+
+    sql = (f"SELECT {', '.join(name for name, type_code in TABLE_COLUMNS[table])} "
+           f"FROM {table}")
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {ORDER_COLUMN[table]}"
+
+    # read only, so a missing database isn't created and the game can keep writing
+    connection = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, timeout=30)
+    try:
+        cursor = connection.execute(sql, parameters)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        connection.close()
+
+
+def write_csv(rows, columns, file):
+    """
+    Writes rows as CSV with a heading row
+    :param columns: TABLE_COLUMNS entry
+    :param file: text file (opened with newline="")
+    :return: number of rows written
+    """
+    writer = csv.writer(file)
+    writer.writerow([name for name, type_code in columns])
+
+    row_count = 0
+    for row_count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+
+    return row_count
+
+
+def write_json_lines(rows, columns, file):
+    """
+    Writes each row as a JSON object on its own line.  Colours / scores are
+    stored as JSON lists already, so their text is written as it is (as lists,
+    without decoding them first).
+    :return: number of rows written
+    """
+    encode_text = json.JSONEncoder(ensure_ascii=False).encode
+
+    # '{"name": %s, ...}' with a way of turning each column into JSON
+    template = "{" + ", ".join(f"{encode_text(name)}: %s" for name, type_code in columns) + "}\n"
+    converters = [str if name in ["colours", "scores"] else encode_text if type_code == "s"
+                  else encode_number for name, type_code in columns]
+
+    row_count = 0
+    for row_count, row in enumerate(rows, start=1):
+        file.write(template % tuple([convert(value) for convert, value in zip(converters, row)]))
+
+    return row_count
+
+
+def encode_number(value):
+    return "null" if value is None else repr(value)
+
+
+def make_column(type_code, values):
+    """
+    Turns one column of a chunk into bytes
+    """
+    if type_code == "s":
+        text = [str(value).encode() for value in values]
+        offsets = array("I", [0])
+        size = 0
+        for item in text:
+            size += len(item)
+            offsets.append(size)
+        return padded(offsets.tobytes()) + padded(b"".join(text))
+
+    if type_code == "d":
+        values = [float("nan") if value is None else value for value in values]
+    return array(type_code, values).tobytes()
+
+
+def write_columns(rows, columns, file, chunk_rows=CHUNK_ROWS):
+    """
+    Writes rows in the columnar format (a chunk at a time, so memory use
+    depends on the chunk size, not the number of rows)
+    :param file: binary file
+    :return: number of rows written
+    """
+    header = [HEADER.pack(MAGIC, BYTE_ORDER, len(columns))]
+    for name, type_code in columns:
+        encoded = name.encode()
+        header.append(type_code.encode() + bytes([len(encoded)]) + encoded)
+    file.write(padded(b"".join(header)))
+
+    row_count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            row_count += write_chunk(file, columns, chunk)
+            chunk = []
+
+    if chunk:
+        row_count += write_chunk(file, columns, chunk)
+    file.write(CHUNK.pack(0))
+
+    return row_count
+
+
+def write_chunk(file, columns, chunk):
+    file.write(CHUNK.pack(len(chunk)))
+    for [name, type_code], values in zip(columns, zip(*chunk)):
+        file.write(make_column(type_code, values))
+    return len(chunk)
+
+
+def read_columns(file):
+    """
+    Reads a columnar file back a chunk at a time
+    :param file: binary file
+    :return: generator of dictionaries (column name -> list of values)
+    """
+    magic, byte_order, column_count = HEADER.unpack(read_exactly(file, HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a Colour Quest export")
+    swap = byte_order != BYTE_ORDER
+
+    columns = []
+    header_size = HEADER.size
+    for count in range(column_count):
+        type_code, name_size = read_exactly(file, 2)
+        columns.append([read_exactly(file, name_size).decode(), chr(type_code)])
+        header_size += 2 + name_size
+    read_exactly(file, -header_size % 8)
+
+    while True:
+        [rows] = CHUNK.unpack(read_exactly(file, CHUNK.size))
+        if rows == 0:
+            return
+
+        chunk = {}
+        for name, type_code in columns:
+            if type_code == "s":
+                offsets = read_array(file, "I", rows + 1, swap)
+                data = read_exactly(file, offsets[-1] + -offsets[-1] % 8)
+                chunk[name] = [data[offsets[count]:offsets[count + 1]].decode()
+                               for count in range(rows)]
+            else:
+                chunk[name] = read_array(file, type_code, rows, swap).tolist()
+        yield chunk
+
+
+def read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("Export is cut short")
+    return data
+
+
+def read_array(file, type_code, count, swap):
+    """
+    Reads a section of numbers (skipping its padding)
+    """
+    values = array(type_code)
+    size = count * values.itemsize
+    values.frombytes(read_exactly(file, size))
+    read_exactly(file, -size % 8)
+    if swap:
+        values.byteswap()
+    return values
+
+
+# File format -> [writer, binary file?]
+FORMATS = {
+    "csv": [write_csv, False],
+    "jsonl": [write_json_lines, False],
+    "cqcol": [write_columns, True],
+}
+
+
+def export(table, file_name, file_format=None, **filters):
+    """
+    Exports a table from the history store.  The file is written next to
+    the old one and swapped in so readers never see half an export.
+    :param file_name: file to write ("-" for standard output)
+    :param file_format: csv / jsonl / cqcol (taken from the file name if not given)
+    :param filters: passed to read_rows() (db_file, player, since, until)
+    :return: number of rows written
+    """
+    if file_format is None:
+        file_format = os.path.splitext(file_name)[1].lstrip(".").lower()
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown export format: {file_format or file_name}")
+
+    writer, binary = FORMATS[file_format]
+    rows = read_rows(table, **filters)
+    columns = TABLE_COLUMNS[table]
+
+    if file_name == "-":
+        if binary:
+            return writer(rows, columns, sys.stdout.buffer)
+        return writer(rows, columns, sys.stdout)
+
+    temp_file = f"{file_name}.{os.getpid()}.tmp"
+    try:
+        if binary:
+            with open(temp_file, "wb") as file:
+                row_count = writer(rows, columns, file)
+        else:
+            with open(temp_file, "w", newline="", encoding="utf-8") as file:
+                row_count = writer(rows, columns, file)
+        os.replace(temp_file, file_name)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    return row_count
+
+
+def get_time(text):
+    """
+    Reads a date (YYYY-MM-DD, local time) or seconds since 1970 from the command line
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+
+    try:
+        return time.mktime(time.strptime(text, "%Y-%m-%d"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Not a date (YYYY-MM-DD): {text}")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Export Colour Quest game history")
+    parser.add_argument("table", choices=list(TABLE_COLUMNS), help="what to export")
+    parser.add_argument("file_name", help="file to write (- for standard output)")
+    parser.add_argument("-f", "--format", choices=list(FORMATS),
+                        help="file format (taken from the file name if not given)")
+    parser.add_argument("-p", "--player", help="only this player's games / rounds")
+    parser.add_argument("--since", type=get_time, help="from this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=get_time, help="up to (not including) this date")
+    parser.add_argument("--db", default=HISTORY_FILE, help="history database")
+    options = parser.parse_args(args)
+
+    if options.file_name == "-" and options.format is None:
+        options.format = "jsonl"
+
+    start = time.perf_counter()
+    try:
+        row_count = export(options.table, options.file_name, options.format,
+                           db_file=options.db, player=options.player,
+                           since=options.since, until=options.until)
+    except (ValueError, OSError, sqlite3.Error) as error:
+        parser.error(str(error))
+    taken = time.perf_counter() - start
+
+    print(f"Exported {row_count} {options.table} in {taken:.2f} seconds", file=sys.stderr)
+
+
+# main routine
+if __name__ == "__main__":
+    main()